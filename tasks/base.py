@@ -1,17 +1,33 @@
 from abc import ABC, abstractmethod
 import logging
+from utils.adb_async import AsyncADBController
 
 class BaseTask(ABC):
     def __init__(self):
         self.name = "未命名任务"
         self.description = "无描述"
         self.priority = 0
+        self.uses_audio = False  # 是否通过虚拟麦克风播放语音(多设备并行时需要各自的输出设备)
         self.logger = logging.getLogger('HwlloETS')
+        self._async_adb = None
 
     @abstractmethod
     async def execute(self, **kwargs):
         pass
 
+    async def get_async_adb(self, adb_controller, kwargs):
+        """取得调度器传入的异步ADB连接(kwargs中的async_adb)
+        按旧的方式只传入adb_controller调用时，自行建立一个连接并在之后的执行中复用
+        """
+        async_adb = kwargs.get('async_adb')
+        if async_adb is not None:
+            return async_adb
+        if self._async_adb is None:
+            self._async_adb = AsyncADBController(adb_controller.host, adb_controller.port)
+        if not self._async_adb.device and not await self._async_adb.connect():
+            raise Exception("无法连接到ADB设备")
+        return self._async_adb
+
     def get_info(self):
         return {
             "name": self.name,
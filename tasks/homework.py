@@ -1,9 +1,15 @@
 from .base import BaseTask
 import asyncio
+import hashlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from utils.screenshot import ScreenshotManager
 from utils.ocr import OCRProcessor
 from utils.tts import TTSManager
-import numpy as np
+from utils.screen_state import ScreenStateClassifier
+from utils.segmenter import SentenceSegmenter
+from utils.locator import UILocator
+from utils.navigator import Navigator
 import os
 
 class HomeworkTask(BaseTask):
@@ -12,11 +18,13 @@ class HomeworkTask(BaseTask):
         self.name = "听说作业"
         self.description = "自动完成所有作业集中的课文听说作业"
         self.priority = 10  # 调整为较大的数值，在启动应用后执行
+        self.uses_audio = True
         
         # 定义UI元素位置
         self.tab_homework = {
             'description': '作业选项卡',
             'type': 'position',
+            'template': 'tab_homework',
             'x': 616,  # 从左往右第四个选项卡的x坐标
             'y': 1532  # 底部导航栏的y坐标
         }
@@ -24,6 +32,7 @@ class HomeworkTask(BaseTask):
         self.first_todo = {
             'description': '第一个待完成作业',
             'type': 'position',
+            'template': 'first_todo',
             'x': 742,
             'y': 992
         }
@@ -31,6 +40,7 @@ class HomeworkTask(BaseTask):
         self.start_homework = {
             'description': '开始做作业按钮',
             'type': 'position',
+            'template': 'start_homework',
             'x': 454,  # 屏幕中央
             'y': 1528  # 底部按钮位置
         }
@@ -52,6 +62,7 @@ class HomeworkTask(BaseTask):
         self.pause_button = {
             'description': '暂停跟读按钮',
             'type': 'position',
+            'template': 'pause_button',
             'x': 458,
             'y': 1434
         }
@@ -59,6 +70,7 @@ class HomeworkTask(BaseTask):
         self.fastread_button = {
             'description': '速读按钮',
             'type': 'position',
+            'template': 'fastread_button',
             'x': 200,
             'y': 1408
         }
@@ -83,6 +95,14 @@ class HomeworkTask(BaseTask):
         
         self.follow_sentences_step_height = 29 # 每29像素拼接一次
         
+        # 文本区域中出现这些颜色说明该句子已读或正在读
+        self.follow_unexpected_colors = [
+            [248, 253, 245],  # 浅绿色 (BGR)
+            [88, 219, 29],    # 绿色 (BGR)
+            [2, 167, 255],    # 黄色 (BGR)
+            [82, 82, 255],    # 红色 (BGR)
+            [0, 0, 0]         # 纯黑色
+        ]
         self.stop_recording_button = {
             'description': '停止录音按钮',
             'type': 'position',
@@ -93,204 +113,285 @@ class HomeworkTask(BaseTask):
         self.finish_button = {
             'description': '完成作业按钮',
             'type': 'position',
+            'template': 'finish_button',
             'x': 652,
             'y': 1556
         }
         
+        '''
+        画面状态表: 状态名 -> [(x, y, BGR颜色, 误差), ...]
+            所有关键点都符合时画面处于该状态，多个状态可以同时成立
+        '''
+        white = (255, 255, 255)
+        self.state_table = {
+            'loaded': [(self.wait_for_loaded['x'], self.wait_for_loaded['y'], white, 0)],  # 作业加载完成
+            'follow': [(self.determine_homework_type['x'], self.determine_homework_type['y'], white, 0)],  # 跟读作业
+            'fastread': [(self.fastread_button['x'], self.fastread_button['y'], (245, 138, 48), 0)],  # 已切换速读
+            'playing': [(x, y, white, 0) for x, y in self.playing_checkpoints],  # 对方朗读中
+            'recording': [(self.stop_recording_button['x'], self.stop_recording_button['y'], (67, 57, 255), 0)],  # 我方录音中
+            'finished': [(self.finish_button['x'], self.finish_button['y'], (255, 143, 54), 0)],  # 可以完成作业
+        }
+        
+        # 设置了locator.base_resolution时以上坐标按设备分辨率换算，再创建状态分类器和句子分割器
+        self.locator = UILocator()
+        self.resolution = None
+        self.states = None
+        self._build_layout(self.locator.base_resolution)
+        self.wait_timeout = 60  # 每次等待画面变化的最长时间(秒)
+
         # 添加调试图片保存路径
         self.debug_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'debug', 'ocr_images')
         os.makedirs(self.debug_dir, exist_ok=True)
         
         self.ocr = OCRProcessor()  # 初始化OCR处理器
         self.tts = TTSManager()
+        # 预取句子的OCR在线程池中执行，不阻塞事件循环(每次执行时创建，结束时关闭)
+        self.executor = None
+        self.prefetched = {}  # 整页预取的句子: 句子图片的内容摘要 -> 生成语音文件的future
+
+    def _build_layout(self, size):
+        """按设备分辨率size=(宽, 高)换算关键点和文本范围"""
+        if self.states is not None and size == self.resolution:
+            return
+        self.resolution = size
+        scale = self.locator.scale_point
+        self.states = ScreenStateClassifier({
+            name: [(*scale(x, y, size), color, tolerance) for x, y, color, tolerance in probes]
+            for name, probes in self.state_table.items()
+        })
+        step_height = self.locator.scale_length(self.follow_sentences_step_height, size)
+        self.segmenter = SentenceSegmenter(
+            self.locator.scale_rect(self.follow_sentences_range, size), step_height, self.follow_unexpected_colors)
+
+    async def _tap(self, async_adb, screenshot_mgr, element, state=None):
+        """在最近一帧画面中定位元素并点击(后台截图一直在运行，不另外截图)
+        state: 元素所在的画面状态，同一状态下只匹配一次
+        """
+        x, y = self.locator.locate(screenshot_mgr.last_frame, element, state, self.resolution)
+        await async_adb.tap(x, y)
+
+    def _recognize_sentence(self, image_to_ocr):
+        """识别句子图片，返回句子文本，失败时返回None"""
+        text = self.ocr.recognize_text(image_to_ocr)
+        text = text.split('\n', 1)[-1]
+        text = text.replace('\n', ' ')
+        text = text.replace('|', 'I')
+        if not text:
+            self.logger.warning("句子识别失败")
+            return None
+        self.logger.info(f"当前句子: {text}")
+        return text
+
+    def _prefetch_sentence(self, image_to_ocr, priority):
+        """在线程池中识别句子并提交语音合成，不等待合成完成，返回句子文本(识别失败时为None)"""
+        text = self._recognize_sentence(image_to_ocr)
+        if text:
+            self.tts.submit(text, priority=priority)
+        return text
+
+    async def _prepare_audio(self, image_to_ocr, prefetched=None):
+        """取得句子的语音文件路径，失败时返回None
+        prefetched: 预取该句的Future；预取还没开始时取消它，改为立即识别
+        当前急需的句子在线程池之外识别，不排在其他句子的预取之后
+        """
+        if prefetched is not None and not prefetched.cancel():
+            text = await asyncio.wrap_future(prefetched)
+        else:
+            text = await asyncio.to_thread(self._recognize_sentence, image_to_ocr)
+        if not text:
+            return None
+        # 以最高优先级合成，预取时已在排队的同一句会提前
+        return await asyncio.wrap_future(self.tts.submit(text, priority=-1))
+
+    def _crop_block(self, screen, block):
+        head_y, tail_y = block
+        left_x = self.segmenter.left
+        right_x = self.segmenter.right
+        return screen[head_y:tail_y, left_x:right_x].copy()
+
+    def _block_key(self, image):
+        """句子图片的内容摘要，作为预取结果的键
+        去掉上下的空白行后再计算，页面滚动后同一句仍得到相同的键，而换成别的句子时一定不同
+        """
+        rows = np.flatnonzero((image != self.segmenter.background).any(axis=(1, 2)))
+        if rows.size:
+            image = image[rows[0]:rows[-1] + 1]
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{image.shape}".encode())
+        digest.update(np.ascontiguousarray(image).data)
+        return digest.hexdigest()
+
+    async def _exact_frame(self, screenshot_mgr, frame):
+        """返回用于句子分割和OCR的无损画面
+        视频流的画面有压缩误差(tolerance>0)，而句子分割、内容摘要和OCR都依赖准确的颜色，此时改用一次screencap
+        """
+        if not frame.tolerance:
+            return frame
+        exact = await asyncio.to_thread(screenshot_mgr.get_frame, True)
+        if exact is None:
+            raise RuntimeError("截图失败")
+        return exact
+
+    def _prefetch(self, screen):
+        """找出整页的所有句子，在线程池中按朗读顺序依次识别并生成语音"""
+        self.prefetched = {}
+        for index, block in enumerate(self.segmenter.find_blocks(screen)):
+            # 越靠前的句子越早需要，优先合成
+            image = self._crop_block(screen, block)
+            self.prefetched[self._block_key(image)] = self.executor.submit(self._prefetch_sentence, image, index)
+        self.logger.info(f"已开始预取整页句子，共 {len(self.prefetched)} 句")
+
+    async def _play(self, screenshot_mgr, audio_file, frame):
+        """播放语音的同时继续监视画面，录音提前结束(例如出现完成按钮)时立即停止播放
+        frame: 检测到录音开始的那一帧
+        """
+        playback = self.tts.play(audio_file)
+        if playback is None:
+            self.logger.error("语音播放失败")
+            return False
+        recording = self.states.condition('recording')
+        watcher = asyncio.ensure_future(screenshot_mgr.wait_until(
+            lambda f: not recording(f), stable_frames=2, after_seq=frame.seq))
+        player = asyncio.ensure_future(playback.wait(timeout=playback.duration + 2))
+        try:
+            await asyncio.wait({watcher, player}, return_when=asyncio.FIRST_COMPLETED)
+            if not playback.done():
+                playback.stop()
+                self.logger.info(f"录音已结束，停止播放 (已播放 {playback.progress:.0%})")
+            completed = await player
+        except asyncio.TimeoutError:
+            playback.stop()
+            self.logger.error("语音播放超时")
+            return False
+        finally:
+            watcher.cancel()
+        if playback.started_at is not None:
+            # 从检测到录音开始的那一帧算起，统计开始播放的延迟
+            self.logger.info(f"录音开始到播放开始的延迟: {(playback.started_at - frame.timestamp) * 1000:.0f} ms")
+        if completed:
+            self.logger.info("语音播放成功")
+        return completed
 
     async def execute(self, adb_controller, **kwargs):
         screenshot_mgr = ScreenshotManager(adb_controller)
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='HomeworkPipeline')
         try:
             self.logger.info("开始执行听说作业任务")
+            async_adb = await self.get_async_adb(adb_controller, kwargs)
+            navigator = Navigator(adb_controller, async_adb, screenshot_mgr)
+            # 后台连续截图，页面跳转和所有轮询共用同一个截图流
+            screenshot_mgr.start_capture()
+            frame = await screenshot_mgr.next_frame(timeout=self.wait_timeout)
+            self._build_layout((frame.width, frame.height))
             
             # 1. 点击作业选项卡
             self.logger.info("正在切换到作业页面...")
-            adb_controller.tap(self.tab_homework['x'], self.tab_homework['y'])
-            await asyncio.sleep(5)  # 等待页面加载
+            # 等待页面加载完成(画面稳定)
+            await navigator.navigate(lambda: self._tap(async_adb, screenshot_mgr, self.tab_homework, 'main'))
             
             # 2. 点击第一个"去完成"按钮
             self.logger.info("正在进入第一个作业...")
-            adb_controller.tap(self.first_todo['x'], self.first_todo['y'])
-            await asyncio.sleep(5)
+            await navigator.navigate(lambda: self._tap(async_adb, screenshot_mgr, self.first_todo))
             
             # 3. 点击"做作业"按钮
             
             homework_type = '' # follow 或者 read
             
-            self.logger.info("正在打开作业...")
-            adb_controller.tap(self.start_homework['x'], self.start_homework['y'])
-            await asyncio.sleep(1)
-            
             # 4. 等待加载完成
-            self.logger.info("等待作业加载完成...")
-            times = 0
-            while True:
-                screen = screenshot_mgr.get_screenshot(force_new=True)
-                if screen is not None:
-                    # 获取指定位置的颜色（BGR格式）
-                    color = screen[self.wait_for_loaded['y'], self.wait_for_loaded['x']]
-                    # 检查是否为纯白色 (255, 255, 255)
-                    if np.array_equal(color, [255, 255, 255]):
-                        times+=1
-                        if(times >= 3): # 三次以上判定为成功
-                            self.logger.info("作业加载完成")
-                            break
-                await asyncio.sleep(0.2)  # 每0.2秒检查一次
+            self.logger.info("正在打开作业，等待加载完成...")
+            # 画面变化后连续三帧为纯白色判定为加载完成
+            frame = await navigator.navigate(lambda: self._tap(async_adb, screenshot_mgr, self.start_homework,
+                                                               'homework_detail'),
+                                             timeout=self.wait_timeout,
+                                             condition=self.states.condition('loaded'), stable_frames=3)
+            self.logger.info("作业加载完成")
                 
             # 5. 判断作业类型
-            screen = screenshot_mgr.get_screenshot(force_new=True)
-            if screen is not None:
-                # 获取指定位置的颜色（BGR格式）
-                color = screen[self.determine_homework_type['y'], self.determine_homework_type['x']]
-                # 检查是否为纯白色 (255, 255, 255)
-                if np.array_equal(color, [255, 255, 255]):
-                    homework_type = 'follow'
-                else:
-                    homework_type = 'read'
-                self.logger.info(f"作业类型：{"跟读" if homework_type == 'follow' else "朗读"}")
+            homework_type = 'follow' if 'follow' in self.states.match(frame) else 'read'
+            self.logger.info(f"作业类型：{'跟读' if homework_type == 'follow' else '朗读'}")
                 
             # 6. 跟读处理逻辑
             if homework_type == 'follow':
+                # 加载完成后整篇文本都已显示，提前识别并生成所有句子的语音
+                self._prefetch((await self._exact_frame(screenshot_mgr, frame)).bgr)
+                
                 # 6.1 暂停跟读和切换速读
-                adb_controller.tap(self.pause_button['x'], self.pause_button['y'])
+                await self._tap(async_adb, screenshot_mgr, self.pause_button, 'follow')
                 
-                screen = screenshot_mgr.get_screenshot(force_new=True)
-                if screen is not None:
-                    # 获取指定位置的颜色（BGR格式）
-                    color = screen[self.fastread_button['y'], self.fastread_button['x']]
-                    # 检查是否蓝色 (48, 138, 245)
-                    if not np.array_equal(color, [245, 138, 48]):
-                        adb_controller.tap(self.fastread_button['x'], self.fastread_button['y'])
-                        self.logger.info("切换速读")
+                frame = await screenshot_mgr.next_frame(screenshot_mgr.seq)
+                if 'fastread' not in self.states.match(frame):
+                    await self._tap(async_adb, screenshot_mgr, self.fastread_button, 'follow')
+                    self.logger.info("切换速读")
                 await asyncio.sleep(1)
                 
                 # 6.2 开始朗读
-                adb_controller.tap(self.pause_button['x'], self.pause_button['y'])
+                await self._tap(async_adb, screenshot_mgr, self.pause_button, 'follow')
                 
                 # 6.3 依次朗读
+                self.segmenter.reset()
                 while True:
                     # 6.3.1 等待评分完成（等对面入机朗读）
-                    while True:
-                        screen = screenshot_mgr.get_screenshot(force_new=True)
-                        if screen is not None:
-                            # 获取指定位置的颜色（BGR格式）
-                            color1 = screen[self.playing_checkpoints[0][1], self.playing_checkpoints[0][0]]
-                            color2 = screen[self.playing_checkpoints[1][1], self.playing_checkpoints[1][0]]
-                            # 检查是否为纯白色 (255, 255, 255)
-                            if np.array_equal(color1, [255, 255, 255]) and np.array_equal(color2, [255, 255, 255]):
-                                self.logger.info("对方朗读开始")
-                                break
-                        await asyncio.sleep(0.07)  # 每0.07秒检查一次
+                    frame = await screenshot_mgr.wait_until(self.states.condition('playing'), timeout=self.wait_timeout)
+                    self.logger.info("对方朗读开始")
                     # 6.3.2 OCR识别内容
                     # 6.3.2.1 选择图片的正确区域
                     
-                    screen = screenshot_mgr.get_screenshot(force_new=True)
-                    if screen is None:
-                        continue
+                    frame = await screenshot_mgr.next_frame(frame.seq)
+                    screen = (await self._exact_frame(screenshot_mgr, frame)).bgr
                         
-                    # 初始化方形选择器
-                    head_y = self.follow_sentences_range['top']
-                    tail_y = head_y
-                    left_x = self.follow_sentences_range['left']
-                    right_x = self.follow_sentences_range['right']
-                    bottom_limit = self.follow_sentences_range['bottom']
-                    
+                    # 查找下一句待读句子的区域(从上一句的位置继续向下查找)
                     image_to_ocr = None
-                    while tail_y <= bottom_limit:
-                        tail_y += self.follow_sentences_step_height
-                        # 获取当前矩形区域
-                        roi = screen[head_y:tail_y, left_x:right_x]
-                        
-                        # 检查是否有异常颜色 - 使用向量化操作
-                        unexpected_colors = np.array([
-                            [248, 253, 245],  # 浅绿色 (BGR)
-                            [88, 219, 29],    # 绿色 (BGR)
-                            [2, 167, 255],    # 黄色 (BGR)
-                            [82, 82, 255],    # 红色 (BGR)
-                            [0, 0, 0]         # 纯黑色
-                        ])
-                        
-                        # 使用向量化操作检查颜色
-                        has_unexpected_color = False
-                        for color in unexpected_colors:
-                            if np.any(np.all(roi == color, axis=2)):
-                                has_unexpected_color = True
-                                break
-                        
-                        if has_unexpected_color:
-                            # self.logger.info(f"坐标{head_y}到{tail_y}不行")
-                            head_y = tail_y
-                            continue
-                        
-                        if tail_y - head_y >= 2 * self.follow_sentences_step_height:
-                            # 首先检查当前区域是否包含非白色像素
-                            has_non_white = not np.all(roi == [255, 255, 255])
-                            
-                            if has_non_white:  # 只有当前区域包含非白色像素时才检查上方区域
-                                # 检查向上两倍step_height的范围是否都是白色
-                                upper_region = screen[tail_y - 2 * self.follow_sentences_step_height:tail_y, left_x:right_x]
-                                # 使用向量化操作检查白色
-                                all_white_above = np.all(upper_region == [255, 255, 255])
-
-                                if all_white_above:
-                                    image_to_ocr = roi.copy()
-                                    self.logger.info(f"找到文本区域：y1={head_y}, y2={tail_y}")
-                                    break
-                            else:
-                                head_y = tail_y  # 如果当前区域全白，直接移动到下一个区域
+                    block = self.segmenter.track(screen)
+                    if block is not None:
+                        image_to_ocr = self._crop_block(screen, block)
+                        self.logger.info(f"找到文本区域：y1={block[0]}, y2={block[1]}")
                     
-                    # 6.3.2.2 执行OCR识别
-                    text = None
+                    # 6.3.2.2 在后台执行OCR识别并生成语音，与对方朗读同时进行
+                    pending = None
                     if image_to_ocr is not None:
-                        text = self.ocr.recognize_text(image_to_ocr)
-                        text = text.split('\n', 1)[-1]
-                        text = text.replace('\n', ' ')
-                        text = text.replace('|', 'I')
-                        if text:
-                            self.logger.info(f"当前句子: {text}")
-                        else:
-                            self.logger.warning("句子识别失败")
+                        if not self.prefetched:
+                            # 新的子作业，先预取整页
+                            self._prefetch(screen)
+                        # 按内容查找，页面滚动后同一位置可能已经是另一句
+                        prefetched = self.prefetched.get(self._block_key(image_to_ocr))
+                        if prefetched is not None:
+                            self.logger.info("使用预取的句子")
+                        pending = asyncio.ensure_future(self._prepare_audio(image_to_ocr, prefetched))
                     else:
                         self.logger.warning("未找到合适的文本区域")
                     
-                    # 6.3.3 将识别出的文本转化为语音文件并播放
-                    audio_file = self.tts.text_to_speech(text)
+                    frame = await screenshot_mgr.wait_until(self.states.condition('recording'), timeout=self.wait_timeout)
+                    self.logger.info("我方朗读开始")
                     
-                    while True:
-                        screen = screenshot_mgr.get_screenshot(force_new=True)
-                        if screen is not None:
-                            # 获取指定位置的颜色（BGR格式）
-                            color = screen[self.stop_recording_button['y'], self.stop_recording_button['x']]
-                            if np.array_equal(color, [67, 57, 255]):
-                                self.logger.info("我方朗读开始")
-                                break
-                        await asyncio.sleep(0.05)  # 每0.05秒检查一次
+                    # 6.3.3 取得生成的语音文件并播放
+                    audio_file = None
+                    if pending is not None:
+                        if not pending.done():
+                            self.logger.warning("语音尚未生成，等待中...")
+                        audio_file = await pending
                     
                     if audio_file:
-                        if self.tts.play_audio(audio_file):
-                            self.logger.info("语音播放成功")
-                        else:
-                            self.logger.error("语音播放失败")
+                        await self._play(screenshot_mgr, audio_file, frame)
                             
-                    screen = screenshot_mgr.get_screenshot(force_new=True)
-                    if screen is not None:
-                        # 获取指定位置的颜色（BGR格式）
-                        color = screen[self.finish_button['y'], self.finish_button['x']]
-                        # 检查是否蓝色 (48, 138, 245)
-                        if np.array_equal(color, [255, 143, 54]):
-                            adb_controller.tap(self.finish_button['x'], self.finish_button['y'])
-                            self.logger.info("开始下一个子作业")
+                    frame = await screenshot_mgr.next_frame(screenshot_mgr.seq)
+                    if 'finished' in self.states.match(frame):
+                        await self._tap(async_adb, screenshot_mgr, self.finish_button, 'finished')
+                        self.segmenter.reset()
+                        self.prefetched = {}
+                        self.logger.info("开始下一个子作业")
 
             # TODO: 后续步骤将继续完善...
             
             return True
             
+        except asyncio.TimeoutError:
+            self.logger.error("听说作业执行失败: 等待画面变化超时")
+            return False
         except Exception as e:
             self.logger.error(f"听说作业执行失败: {str(e)}")
             return False
+        finally:
+            screenshot_mgr.stop_capture()
+            # 任务结束或失败时取消尚未开始的预取
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.prefetched = {}
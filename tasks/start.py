@@ -1,5 +1,6 @@
 from .base import BaseTask
 import asyncio
+from utils.navigator import Navigator
 
 class StartAppTask(BaseTask):
     def __init__(self):
@@ -13,31 +14,29 @@ class StartAppTask(BaseTask):
     async def execute(self, adb_controller, **kwargs):
         try:
             self.logger.info("开始执行启动任务")
+            async_adb = await self.get_async_adb(adb_controller, kwargs)
+            navigator = Navigator(adb_controller, async_adb)
             
-            # 强制停止应用
+            # 强制停止应用，等待进程退出
             self.logger.info("正在停止应用...")
-            adb_controller.shell(f'am force-stop {self.package_name}')
-            await asyncio.sleep(2)
+            await async_adb.shell(f'am force-stop {self.package_name}')
+            try:
+                await navigator.wait_for_stopped(self.package_name, timeout=5)
+            except asyncio.TimeoutError:
+                self.logger.warning("应用进程未能及时退出")
             
             # 启动应用
             self.logger.info("正在启动应用...")
             start_cmd = f'am start {self.package_name}/{self.activity}'
-            adb_controller.shell(start_cmd)
             
-            # 检查应用是否成功启动
-            timeout = 5
-            start_time = asyncio.get_event_loop().time()
-            
-            while (asyncio.get_event_loop().time() - start_time) < timeout:
-                current_app = adb_controller.shell('dumpsys window | grep mCurrentFocus')
-                if current_app and self.package_name in current_app:
-                    self.logger.info("应用启动成功")
-                    return True
-                await asyncio.sleep(0.5)
+            # 检查应用是否成功启动(在前台)，并等待界面加载完成
+            await navigator.navigate(lambda: async_adb.shell(start_cmd), activity=self.package_name, timeout=10)
+            self.logger.info("应用启动成功")
+            return True
             
+        except asyncio.TimeoutError:
             self.logger.error("应用启动超时")
             return False
-            
         except Exception as e:
             self.logger.error(f"启动任务执行失败: {str(e)}")
             return False
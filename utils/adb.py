@@ -1,40 +1,202 @@
+from adb_shell import constants, exceptions
 from adb_shell.adb_device import AdbDeviceTcp
+from adb_shell.adb_message import AdbMessage
 from adb_shell.auth.sign_pythonrsa import PythonRSASigner
 from .config import Config
 from .log import Logger
+import itertools
 import os
+import threading
+import time
+import uuid
+
+
+def load_adb_signer():
+    """加载ADB密钥，不存在或加载失败时返回None"""
+    try:
+        adbkey_path = os.path.expanduser('~/.android/adbkey')
+        if os.path.exists(adbkey_path):
+            with open(adbkey_path) as f:
+                priv = f.read()
+            with open(adbkey_path + '.pub') as f:
+                pub = f.read()
+            return PythonRSASigner(pub, priv)
+    except Exception as e:
+        Logger().get_logger().warning(f"无法加载ADB密钥: {str(e)}")
+    return None
+
+
+def _build_script(cmds, markers):
+    """把多条命令拼接为一段脚本，每条命令的输出之后跟随一个分隔标记
+    命令的标准输入重定向到/dev/null，否则读取标准输入的命令会吞掉后面的脚本和分隔标记
+    """
+    return ''.join(f'{{ {cmd}\n}} < /dev/null 2>&1; echo {marker}\n' for cmd, marker in zip(cmds, markers))
+
+
+def _split_output(output, markers):
+    """按分隔标记切分脚本输出，返回每条命令各自的输出"""
+    results = []
+    for marker in markers:
+        index = output.find(marker)
+        if index < 0:
+            results.append(None)
+            continue
+        results.append(output[:index])
+        output = output[index + len(marker):].lstrip('\r\n')
+    return results
+
+
+class BatchInterrupted(Exception):
+    """命令已写入会话，但没有读到全部输出时会话失效
+    results: 每条命令的输出，没有读到分隔标记的为None(这些命令可能已经执行，不能重试)
+    """
+
+    def __init__(self, results, cause):
+        super().__init__(str(cause))
+        self.results = results
+
+
+class ShellSession:
+    """常驻的shell会话
+
+    打开一个长期存在的 shell:sh 流，命令写入其标准输入，
+    通过每条命令之后输出的分隔标记来确定输出的边界，
+    从而避免每条命令都重新建立ADB流。
+    adb_shell没有提供向已打开的流写入数据的公开接口，这里直接使用其内部方法。
+    """
+
+    def __init__(self, device, read_timeout_s=10):
+        self.device = device
+        self.read_timeout_s = read_timeout_s
+        self._adb_info = None
+        self._buffer = b''
+        self._lock = threading.Lock()
+        self._prefix = uuid.uuid4().hex[:8]
+        self._counter = itertools.count()
+
+    @property
+    def is_open(self):
+        return self._adb_info is not None
+
+    def open(self):
+        self._adb_info = self.device._open(b'shell:sh', None, self.read_timeout_s, None)
+        self._buffer = b''
+
+    def close(self):
+        info, self._adb_info = self._adb_info, None
+        if info is None:
+            return
+        try:
+            self.device._io_manager.send(AdbMessage(constants.CLSE, info.local_id, info.remote_id), info)
+        except Exception:
+            pass
+
+    def _write(self, data):
+        info = self._adb_info
+        for start in range(0, len(data), self.device.max_chunk_size):
+            chunk = data[start:start + self.device.max_chunk_size]
+            self.device._io_manager.send(AdbMessage(constants.WRTE, info.local_id, info.remote_id, chunk), info)
+            # 等待设备确认，期间收到的输出先放入缓冲区
+            while True:
+                cmd, received = self.device._read_until([constants.OKAY, constants.WRTE, constants.CLSE], info)
+                if cmd == constants.OKAY:
+                    break
+                if cmd == constants.CLSE:
+                    raise ConnectionError("shell会话已被设备关闭")
+                self._buffer += received
+
+    def _read_until_marker(self, marker):
+        marker = marker.encode()
+        while True:
+            index = self._buffer.find(marker)
+            if index >= 0:
+                end = self._buffer.find(b'\n', index)
+                if end >= 0:
+                    output = self._buffer[:end + 1]
+                    self._buffer = self._buffer[end + 1:]
+                    return output.decode('utf-8', errors='replace')
+            cmd, received = self.device._read_until([constants.WRTE, constants.CLSE], self._adb_info)
+            if cmd == constants.CLSE:
+                raise ConnectionError("shell会话已被设备关闭")
+            self._buffer += received
+
+    def run_batch(self, cmds):
+        """一次写入多条命令，返回每条命令的输出
+        写入失败时抛出原异常(命令没有发出，可以改用其他方式执行)；
+        写入后读取失败时抛出BatchInterrupted，其中带有已读到的输出
+        """
+        with self._lock:
+            if not self.is_open:
+                self.open()
+            markers = [f'__HWLLO_{self._prefix}_{next(self._counter)}__' for _ in cmds]
+            try:
+                self._write(_build_script(cmds, markers).encode())
+            except Exception:
+                # 输出边界已无法确定，丢弃当前会话
+                self.close()
+                raise
+            outputs = []
+            try:
+                for marker in markers:
+                    outputs.append(self._read_until_marker(marker))
+            except Exception as e:
+                self.close()
+                raise BatchInterrupted(_split_output(''.join(outputs), markers), e)
+            return _split_output(''.join(outputs), markers)
+
+    def run(self, cmd):
+        return self.run_batch([cmd])[0]
+
 
 class ADBController:
-    def __init__(self):
+    # 表示连接本身已经失效(而不是命令执行失败)的异常
+    TRANSPORT_ERRORS = (OSError, exceptions.TcpTimeoutException, exceptions.AdbConnectionError,
+                        exceptions.AdbTimeoutError, exceptions.InvalidResponseError)
+
+    def __init__(self, host=None, port=None):
         self.config = Config()
+        self.host = host  # 未指定时使用配置中的地址
+        self.port = port
         self.logger = Logger().get_logger()
         self.device = None
+        self.session = None
+        self._session_failed = False
+        self._connect_lock = threading.RLock()
+        self._generation = 0  # 每次成功连接后加一，用于判断其他线程是否已经重连
+        self._keep_connected = False  # 为True时连接断开后自动重连
+        self._last_activity = 0
+        self._keepalive_thread = None
         self._load_adb_keys()
 
     def _load_adb_keys(self):
         """加载ADB密钥"""
-        self.signer = None
-        try:
-            adbkey_path = os.path.expanduser('~/.android/adbkey')
-            if os.path.exists(adbkey_path):
-                with open(adbkey_path) as f:
-                    priv = f.read()
-                with open(adbkey_path + '.pub') as f:
-                    pub = f.read()
-                self.signer = PythonRSASigner(pub, priv)
-        except Exception as e:
-            self.logger.warning(f"无法加载ADB密钥: {str(e)}")
+        self.signer = load_adb_signer()
+
+    @property
+    def connected(self):
+        return self.device is not None and self.device.available
 
     def connect(self):
-        """连接到ADB设备"""
+        """连接到ADB设备，已连接时直接返回"""
+        with self._connect_lock:
+            self._keep_connected = True
+            if self.connected:
+                return True
+            return self._connect_once()
+
+    def _connect_once(self):
         try:
-            host = self.config.get("adb", "host")
-            port = self.config.get("adb", "port")
+            host = self.host or self.config.get("adb", "host")
+            port = self.port or self.config.get("adb", "port")
             
             self.device = AdbDeviceTcp(host, port, default_transport_timeout_s=9.)
             
             # 尝试连接
             self.device.connect(rsa_keys=[self.signer] if self.signer else None, auth_timeout_s=5)
+            self.session = None
+            self._session_failed = False
+            self._generation += 1
+            self._last_activity = time.monotonic()
             self.logger.info(f"已连接到 {host}:{port}")
             return True
             
@@ -43,28 +205,180 @@ class ADBController:
             self.device = None
             return False
 
+    def _drop_device(self):
+        """丢弃当前(可能已失效的)连接"""
+        device, self.device = self.device, None
+        self.session = None
+        if device is not None:
+            try:
+                device.close()
+            except Exception:
+                pass
+
+    def reconnect(self, generation=None):
+        """断开并重新连接，失败时按指数退避重试
+        generation: 调用者发现连接失效时的连接代数，若其他线程已经完成重连则不再重复
+        """
+        with self._connect_lock:
+            if generation is not None and generation != self._generation and self.connected:
+                return True
+            self._keep_connected = True
+            self._drop_device()
+            delay = 0.5
+            max_delay = self.config.get("adb", "reconnect_max_delay")
+            for attempt in range(self.config.get("adb", "reconnect_attempts")):
+                if attempt:
+                    time.sleep(delay)
+                    delay = min(delay * 2, max_delay)
+                if self._connect_once():
+                    return True
+            # 多次重连失败后不再自动重连，直到下一次显式调用connect
+            self._keep_connected = False
+            self.logger.error("ADB重连失败")
+            return False
+
     def disconnect(self):
         """断开ADB连接"""
+        self._keep_connected = False
         if self.device:
             try:
+                self._close_session()
                 self.device.close()
                 self.device = None
                 self.logger.info("ADB连接已断开")
             except Exception as e:
                 self.logger.error(f"断开ADB连接失败: {str(e)}")
 
+    def start_keepalive(self):
+        """启动后台保活线程: 立即建立连接(预热认证)，之后定期探测并在连接失效时重连"""
+        self._keep_connected = True
+        if self._keepalive_thread is not None and self._keepalive_thread.is_alive():
+            return
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, name='ADBKeepalive', daemon=True)
+        self._keepalive_thread.start()
+
+    def _keepalive_loop(self):
+        interval = self.config.get("adb", "keepalive_interval")
+        timeout = self.config.get("adb", "keepalive_timeout")
+        if not self.connect():
+            self._keep_connected = False
+        while True:
+            if self._keep_connected:
+                if self.device is None:
+                    self.reconnect()
+                elif time.monotonic() - self._last_activity >= interval:
+                    # 空闲时发送一条轻量命令探测连接是否仍然可用
+                    generation = self._generation
+                    try:
+                        self.device.shell('echo', transport_timeout_s=timeout, read_timeout_s=timeout)
+                        self._last_activity = time.monotonic()
+                    except Exception as e:
+                        self.logger.warning(f"ADB连接探测失败，正在重连: {str(e)}")
+                        self.reconnect(generation)
+            time.sleep(interval)
+
+    def _ensure_device(self):
+        """返回当前连接，连接已断开且需要保持连接时先尝试重连"""
+        if self.device is None and self._keep_connected:
+            self.reconnect()
+        return self.device
+
+    def _execute(self, operation):
+        """在当前连接上执行操作，连接失效时自动重连并重试一次"""
+        generation = self._generation
+        try:
+            result = operation(self.device)
+        except self.TRANSPORT_ERRORS as e:
+            if not self._keep_connected:
+                raise
+            self.logger.warning(f"ADB连接中断，正在重连: {str(e)}")
+            if not self.reconnect(generation):
+                raise
+            result = operation(self.device)
+        self._last_activity = time.monotonic()
+        return result
+
+    def _get_session(self):
+        """获取常驻shell会话，未启用或不可用时返回None"""
+        if self.session is None and not self._session_failed and self.config.get("adb", "persistent_shell"):
+            session = ShellSession(self.device)
+            try:
+                session.open()
+                self.session = session
+            except Exception as e:
+                self.logger.warning(f"无法建立常驻shell会话，改用单次命令: {str(e)}")
+                self._session_failed = True
+        return self.session
+
+    def _close_session(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
     def shell(self, cmd):
         """执行shell命令"""
-        if not self.device:
+        return self.batch([cmd])[0]
+
+    def batch(self, cmds):
+        """在一次写入中依次执行多条shell命令，返回每条命令的输出列表"""
+        if not self._ensure_device():
+            self.logger.error("ADB未连接")
+            return [None] * len(cmds)
+
+        try:
+            return self._execute(lambda device: self._run_batch(device, cmds))
+        except Exception as e:
+            self.logger.error(f"执行命令失败 '{'; '.join(cmds)}': {str(e)}")
+            return [None] * len(cmds)
+
+    def _run_batch(self, device, cmds):
+        session = self._get_session()
+        if session is not None:
+            try:
+                return session.run_batch(cmds)
+            except BatchInterrupted as e:
+                # 命令已经发出，重新执行会重复点击等操作，只返回已读到的输出
+                self.logger.warning(f"常驻shell会话在执行中失效，{e.results.count(None)} 条命令没有得到输出: {str(e)}")
+                self.session = None
+                return e.results
+            except Exception as e:
+                self.logger.warning(f"常驻shell会话失效，改用单次命令: {str(e)}")
+                self.session = None
+
+        if len(cmds) == 1:
+            return [device.shell(cmds[0])]
+        # 没有常驻会话时，同样把多条命令合并到一次调用中
+        markers = [f'__HWLLO_BATCH_{i}__' for i in range(len(cmds))]
+        return _split_output(device.shell(_build_script(cmds, markers)), markers)
+
+    def exec_out(self, cmd):
+        """执行命令并以bytes形式返回原始输出"""
+        if not self._ensure_device():
             self.logger.error("ADB未连接")
             return None
-        
+
         try:
-            return self.device.shell(cmd)
+            return self._execute(lambda device: device.exec_out(cmd, decode=False))
         except Exception as e:
             self.logger.error(f"执行命令失败 '{cmd}': {str(e)}")
             return None
 
+    def streaming_shell(self, cmd, timeout_s=None):
+        """执行shell命令，以bytes块的形式持续返回输出
+        timeout_s: 等待输出的超时时间(秒)，默认使用连接的超时设置
+        """
+        if not self.device:
+            self.logger.error("ADB未连接")
+            return
+
+        try:
+            kwargs = {}
+            if timeout_s is not None:
+                kwargs = {'transport_timeout_s': timeout_s, 'read_timeout_s': timeout_s}
+            yield from self.device.streaming_shell(cmd, decode=False, **kwargs)
+        except Exception as e:
+            self.logger.error(f"执行命令失败 '{cmd}': {str(e)}")
+
     def tap(self, x, y):
         """模拟点击"""
         return self.shell(f'input tap {x} {y}')
@@ -73,12 +387,17 @@ class ADBController:
         """模拟滑动"""
         return self.shell(f'input swipe {x1} {y1} {x2} {y2} {duration}')
 
-    def screencap(self):
-        """截图"""
-        if not self.device:
+    def screencap(self, raw=False):
+        """截图
+        raw: 为True时返回未编码的帧缓冲数据(头部+像素)，否则返回PNG数据
+        """
+        if not self._ensure_device():
             return None
         try:
-            return self.device.shell('screencap -p', decode=False)
+            if raw:
+                # exec-out不经过终端转换，可以安全地传输二进制数据
+                return self._execute(lambda device: device.exec_out('screencap', decode=False))
+            return self._execute(lambda device: device.shell('screencap -p', decode=False))
         except Exception as e:
             self.logger.error(f"截图失败: {str(e)}")
             return None
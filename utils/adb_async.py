@@ -0,0 +1,135 @@
+import asyncio
+import threading
+from adb_shell.adb_device_async import AdbDeviceTcpAsync
+from .adb import ADBController, load_adb_signer
+from .config import Config
+from .log import Logger
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def shared_loop():
+    """常驻后台线程中的事件循环，GUI每次执行任务都在这个循环中运行，绑定在其上的异步连接可以一直复用"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='TaskEventLoop', daemon=True).start()
+        return _loop
+
+
+class AsyncADBController:
+    """基于adb_shell异步TCP设备的ADB控制器
+
+    所有操作均可await，不会阻塞事件循环；
+    通过信号量限制同时进行的命令数量，每条命令都有超时时间。
+    shared()返回每个设备常驻的实例(只在shared_loop()中使用)，认证只做一次，连接失效时在下一条命令前重连。
+    """
+
+    _shared = {}  # (host, port) -> 常驻的实例
+
+    def __init__(self, host=None, port=None):
+        self.config = Config()
+        self.logger = Logger().get_logger()
+        self.host = host or self.config.get("adb", "host")
+        self.port = port or self.config.get("adb", "port")
+        self.timeout = self.config.get("adb", "command_timeout")
+        self.device = None
+        self.signer = load_adb_signer()
+        self._semaphore = asyncio.Semaphore(self.config.get("adb", "max_concurrency"))
+
+    @classmethod
+    def shared(cls, host=None, port=None):
+        """返回该设备常驻的异步连接，没有时创建(尚未连接)"""
+        config = Config()
+        key = (host or config.get("adb", "host"), port or config.get("adb", "port"))
+        if key not in cls._shared:
+            cls._shared[key] = cls(*key)
+        return cls._shared[key]
+
+    async def ensure_connected(self):
+        """尚未连接时连接，已连接时直接返回True"""
+        return self.device is not None or await self.connect()
+
+    async def connect(self):
+        """连接到ADB设备"""
+        try:
+            self.device = AdbDeviceTcpAsync(self.host, self.port, default_transport_timeout_s=9.)
+            await self.device.connect(rsa_keys=[self.signer] if self.signer else None, auth_timeout_s=5)
+            self.logger.info(f"已连接到 {self.host}:{self.port} (异步)")
+            return True
+        except Exception as e:
+            self.logger.error(f"ADB连接失败: {str(e)}")
+            self.device = None
+            return False
+
+    async def disconnect(self):
+        """断开ADB连接"""
+        if self.device:
+            try:
+                await self.device.close()
+                self.device = None
+                self.logger.info("ADB连接已断开 (异步)")
+            except Exception as e:
+                self.logger.error(f"断开ADB连接失败: {str(e)}")
+
+    async def reconnect(self):
+        """断开并重新连接"""
+        device, self.device = self.device, None
+        if device is not None:
+            try:
+                await device.close()
+            except Exception:
+                pass
+        return await self.connect()
+
+    async def _run(self, method, cmd, timeout, decode, retry=True):
+        """在并发限制和超时保护下执行device的shell/exec_out方法，连接失效时重连并重试一次"""
+        # 之前的连接失败或已断开时，先重新连接
+        if not await self.ensure_connected():
+            self.logger.error("ADB未连接")
+            return None
+
+        timeout = timeout or self.timeout
+        try:
+            async with self._semaphore:
+                return await asyncio.wait_for(getattr(self.device, method)(cmd, decode=decode), timeout)
+        except asyncio.TimeoutError:
+            self.logger.error(f"执行命令超时 '{cmd}' ({timeout}秒)")
+            return None
+        except ADBController.TRANSPORT_ERRORS as e:
+            if retry:
+                self.logger.warning(f"ADB连接中断，正在重连: {str(e)}")
+                if await self.reconnect():
+                    return await self._run(method, cmd, timeout, decode, retry=False)
+            self.logger.error(f"执行命令失败 '{cmd}': {str(e)}")
+            return None
+        except Exception as e:
+            self.logger.error(f"执行命令失败 '{cmd}': {str(e)}")
+            return None
+
+    async def shell(self, cmd, timeout=None):
+        """执行shell命令"""
+        return await self._run('shell', cmd, timeout, True)
+
+    async def exec_out(self, cmd, timeout=None):
+        """执行命令并以bytes形式返回原始输出"""
+        return await self._run('exec_out', cmd, timeout, False)
+
+    async def tap(self, x, y):
+        """模拟点击"""
+        return await self.shell(f'input tap {x} {y}')
+
+    async def swipe(self, x1, y1, x2, y2, duration=500):
+        """模拟滑动"""
+        return await self.shell(f'input swipe {x1} {y1} {x2} {y2} {duration}')
+
+    async def screencap(self, raw=False):
+        """截图
+        raw: 为True时返回未编码的帧缓冲数据(头部+像素)，否则返回PNG数据
+        """
+        if raw:
+            return await self.exec_out('screencap')
+        return await self._run('shell', 'screencap -p', None, False)
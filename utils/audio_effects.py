@@ -0,0 +1,58 @@
+import numpy as np
+
+
+def trim_silence(pcm, rate, threshold_db=-40, padding=0.05):
+    """去掉单声道PCM开头和结尾的静音
+    threshold_db: 以满幅为0 dB，10 ms内的均方根低于该值视为静音
+    padding: 两端保留的静音(秒)，避免切掉字头的弱辅音
+    """
+    window = max(1, rate // 100)
+    count = len(pcm) // window
+    if not count:
+        return pcm
+    frames = pcm[:count * window].reshape(count, window)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    voiced = np.flatnonzero(rms > 10 ** (threshold_db / 20))
+    if not voiced.size:
+        return pcm
+    pad = int(padding * rate)
+    start = max(0, voiced[0] * window - pad)
+    end = min(len(pcm), (voiced[-1] + 1) * window + pad)
+    return pcm[start:end]
+
+
+def time_stretch(pcm, rate, tempo, frame_ms=40, search_ms=10):
+    """不改变音调地改变单声道PCM的语速(WSOLA)
+    tempo: 语速倍数，大于1时变快、时长变为原来的1/tempo
+    每一帧在名义位置附近±search_ms内找与上一帧自然延续最相似的位置再叠加，避免相位错位产生的杂音。
+    """
+    frame = int(rate * frame_ms / 1000)
+    if tempo == 1 or len(pcm) < frame * 2:
+        return pcm
+    hop_out = frame // 2
+    hop_in = hop_out * tempo
+    search = int(rate * search_ms / 1000)
+    window = np.hanning(frame).astype(np.float32)
+    padded = np.concatenate([pcm.astype(np.float32, copy=False), np.zeros(frame + search, np.float32)])
+    length = int(len(pcm) / tempo)
+    output = np.zeros(length + frame, np.float32)
+    weight = np.zeros(length + frame, np.float32)
+
+    previous = 0
+    for index, position in enumerate(range(0, length, hop_out)):
+        nominal = int(index * hop_in)
+        if index == 0:
+            start = 0
+        else:
+            # 上一帧在原音频中的自然延续
+            target = padded[previous + hop_out:previous + hop_out + frame]
+            low = max(0, nominal - search)
+            high = min(nominal + search, len(padded) - frame)
+            correlation = np.correlate(padded[low:high + frame], target, 'valid')
+            start = low + int(np.argmax(correlation))
+        output[position:position + frame] += padded[start:start + frame] * window
+        weight[position:position + frame] += window
+        previous = start
+
+    output = output[:length] / np.maximum(weight[:length], 1e-3)
+    return output.astype(np.float32)
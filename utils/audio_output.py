@@ -0,0 +1,188 @@
+import asyncio
+import queue
+import threading
+import time
+import numpy as np
+import sounddevice as sd
+from .log import Logger
+
+
+def _to_mono(pcm):
+    return pcm.mean(axis=1, dtype=np.float32) if pcm.ndim > 1 else pcm.astype(np.float32, copy=False)
+
+
+def _resample(pcm, rate, target_rate):
+    """线性插值重采样，对语音来说足够"""
+    if rate == target_rate or not len(pcm):
+        return pcm
+    count = int(round(len(pcm) * target_rate / rate))
+    positions = np.linspace(0, len(pcm) - 1, count)
+    return np.interp(positions, np.arange(len(pcm)), pcm).astype(np.float32)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def find_output_device(name="CABLE Input"):
+    """查找名称中包含name的输出设备，返回设备ID，找不到时返回None"""
+    for device_id, device in enumerate(sd.query_devices()):
+        # 匹配设备名称（兼容不同版本）
+        if name in device.get('name', '') and device['max_output_channels'] > 0:
+            return device_id  # 选择第一个匹配项
+    return None
+
+
+class Playback:
+    """一次排队中的播放，由输出流的回调线程推进
+
+    可以直接await，播放完毕时得到True，被stop()中止时得到False；
+    progress/elapsed反映已交给声卡的进度。
+    """
+
+    def __init__(self, data, samplerate):
+        self.data = data  # 16位PCM，单声道或与输出流相同的声道数
+        self.samplerate = samplerate
+        self.position = 0  # 已交给声卡的帧数
+        self.started_at = None  # 开始播放的时间(time.time())
+        self.stopped = False
+        self.started = threading.Event()
+        self.finished = threading.Event()
+        self._waiters = []  # 等待结束的(事件循环, Future)
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self):
+        return len(self.data) / self.samplerate
+
+    @property
+    def elapsed(self):
+        """已播放的秒数"""
+        return self.position / self.samplerate
+
+    @property
+    def progress(self):
+        """已播放的比例(0~1)"""
+        return self.position / len(self.data) if len(self.data) else 1.0
+
+    def done(self):
+        return self.finished.is_set()
+
+    def _start(self):
+        self.started_at = time.time()
+        self.started.set()
+
+    def _finish(self):
+        with self._lock:
+            if self.finished.is_set():
+                return
+            self.finished.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def stop(self):
+        """停止播放，还在排队时直接丢弃"""
+        self.stopped = True
+        self._finish()
+
+    async def wait(self, timeout=None):
+        """等待播放结束，播放完毕返回True，被中止返回False
+        timeout: 超时时间(秒)，超时抛出asyncio.TimeoutError(不会停止播放)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.finished.is_set():
+                return not self.stopped
+            self._waiters.append((loop, future))
+        await asyncio.wait_for(future, timeout)
+        return not self.stopped
+
+    def __await__(self):
+        return self.wait().__await__()
+
+
+class AudioOutput:
+    """常驻的音频输出流
+
+    输出流只打开一次并一直运行，没有语音时输出静音；play只把数据放入队列，
+    由回调在下一个音频缓冲区开始播放，不再有每次打开设备的延迟。
+    单声道数据在回调中直接广播到各个声道，不需要预先复制成多声道。
+    """
+
+    def __init__(self, device=None, blocksize=256, latency='low'):
+        self.logger = Logger().get_logger()
+        info = sd.query_devices(device, 'output')
+        self.device = device
+        self.samplerate = int(info['default_samplerate'])
+        self.channels = max(1, min(2, info['max_output_channels']))
+        self.blocksize = blocksize
+        self.latency = latency
+        self._pending = queue.Queue()
+        self._current = None
+        self._stream = None
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        """打开并启动输出流，已在运行时不做任何事"""
+        with self._lock:
+            if self._stream is not None and self._stream.active:
+                return
+            self.close_stream()
+            self._stream = sd.OutputStream(device=self.device, samplerate=self.samplerate, channels=self.channels,
+                                           dtype='int16', blocksize=self.blocksize, latency=self.latency,
+                                           callback=self._callback)
+            self._stream.start()
+            self.logger.info(f"音频输出流已打开: {self.samplerate} Hz, {self.channels} 声道, "
+                             f"延迟 {self._stream.latency * 1000:.0f} ms")
+
+    def close_stream(self):
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except Exception as e:
+                self.logger.warning(f"关闭音频输出流失败: {str(e)}")
+            self._stream = None
+
+    def _prepare(self, data, samplerate):
+        """转换为输出流的采样率和16位PCM，已经符合时不复制(内存映射的缓存直接使用)"""
+        if data.ndim > 1 and data.shape[1] != self.channels:
+            data = _to_mono(data)
+        if samplerate != self.samplerate:
+            data = _resample(_to_mono(data), samplerate, self.samplerate)
+        if data.dtype != np.int16:
+            data = (np.clip(data, -1, 1) * 32767).astype(np.int16)
+        return data
+
+    def play(self, data, samplerate):
+        """把一段PCM放入播放队列，返回Playback"""
+        playback = Playback(self._prepare(data, samplerate), self.samplerate)
+        self._pending.put(playback)
+        self.start()
+        return playback
+
+    def _callback(self, outdata, frames, time_info, status):
+        filled = 0
+        while filled < frames:
+            current = self._current
+            if current is None:
+                try:
+                    current = self._current = self._pending.get_nowait()
+                except queue.Empty:
+                    break
+                if not current.stopped:
+                    current._start()
+            if current.stopped:
+                self._current = None
+                continue
+            chunk = current.data[current.position:current.position + frames - filled]
+            outdata[filled:filled + len(chunk)] = chunk.reshape(len(chunk), -1)
+            current.position += len(chunk)
+            filled += len(chunk)
+            if current.position >= len(current.data):
+                current._finish()
+                self._current = None
+        outdata[filled:] = 0
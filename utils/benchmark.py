@@ -0,0 +1,455 @@
+import argparse
+import json
+import logging
+import os
+import time
+import cv2
+import numpy as np
+from .adb import ADBController
+from .audio_effects import time_stretch, trim_silence
+from .config import Config
+from concurrent.futures import ThreadPoolExecutor
+from .frame_source import ScreencapSource, create_frame_source
+from .locator import UILocator
+from .ocr import OCREnginePool, OCRProcessor, create_ocr_engine
+from .screenshot import ScreenshotManager
+from .segmenter import SentenceSegmenter
+from .tts import create_tts_engine
+
+# 分割器对照用的跟读页面截图及期望结果
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'golden', 'segment')
+
+
+def _measure(func, count):
+    """重复执行func，返回(每秒次数, 每次的CPU耗时毫秒, 每次的实际耗时毫秒)"""
+    func()  # 预热
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(count):
+        func()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    return count / wall, cpu / count * 1000, wall / count * 1000
+
+
+def _report(name, result):
+    rate, cpu_ms, wall_ms = result
+    print(f"{name:<16} {rate:8.2f} 次/秒  CPU {cpu_ms:8.2f} ms/次  耗时 {wall_ms:8.2f} ms/次")
+
+
+def _connect():
+    adb = ADBController()
+    if not adb.connect():
+        raise Exception("无法连接到ADB设备")
+    return adb
+
+
+def bench_screencap(args):
+    """对比原始帧缓冲与PNG两种截图模式"""
+    adb = _connect()
+    try:
+        for mode in ('raw', 'png'):
+            source = ScreencapSource(adb, mode)
+            _report(f"screencap-{mode}", _measure(source.read, args.count))
+    finally:
+        adb.disconnect()
+
+
+def bench_probe(args):
+    """对比设备端取色与完整截图取色"""
+    adb = _connect()
+    try:
+        manager = ScreenshotManager(adb)
+        points = [(463, 1450), (436, 1411)]
+        _report("probe", _measure(lambda: manager.probe(points), args.count))
+        _report("full-frame", _measure(
+            lambda: [manager.get_screenshot(force_new=True)[y, x] for x, y in points], args.count))
+    finally:
+        adb.disconnect()
+
+
+def bench_source(args):
+    """对比各截图来源实际能提供的新帧速率(测试时请让画面保持变化)"""
+    adb = _connect()
+    try:
+        for name in ('screencap', 'h264'):
+            source = create_frame_source(adb, name, Config().get("screenshot"))
+            if not source.open():
+                print(f"{name:<16} 无法打开")
+                continue
+            try:
+                source.read(timeout=5)  # 等待第一帧
+                frames = 0
+                last = None
+                wall_start = time.perf_counter()
+                cpu_start = time.process_time()
+                while frames < args.count:
+                    frame = source.read(timeout=1)
+                    # 视频流在画面静止时会重复返回上一帧，只统计新帧
+                    if frame is not None and frame.pixels is not last:
+                        frames += 1
+                        last = frame.pixels
+                wall = time.perf_counter() - wall_start
+                cpu = time.process_time() - cpu_start
+                _report(f"source-{name}", (frames / wall, cpu / frames * 1000, wall / frames * 1000))
+            finally:
+                source.close()
+    finally:
+        adb.disconnect()
+
+
+def bench_shell(args):
+    """对比每次新建ADB流、常驻shell会话以及批量提交的单条命令延迟"""
+    adb = _connect()
+    try:
+        cmd = 'echo ok'
+        _report("shell-open", _measure(lambda: adb.device.shell(cmd), args.count))
+        _report("shell-session", _measure(lambda: adb.shell(cmd), args.count))
+        # 批量提交时按单条命令折算
+        rate, cpu_ms, wall_ms = _measure(lambda: adb.batch([cmd] * 10), args.count)
+        _report("shell-batch", (rate * 10, cpu_ms / 10, wall_ms / 10))
+    finally:
+        adb.disconnect()
+
+
+def _legacy_find_block(screen, rect, step, unexpected_colors):
+    """原先在HomeworkTask中逐步扩展选择框查找文本区域的实现，作为对照"""
+    head_y = rect['top']
+    tail_y = head_y
+    left_x = rect['left']
+    right_x = rect['right']
+    while tail_y <= rect['bottom']:
+        tail_y += step
+        roi = screen[head_y:tail_y, left_x:right_x]
+        if any(np.any(np.all(roi == color, axis=2)) for color in unexpected_colors):
+            head_y = tail_y
+            continue
+        if tail_y - head_y >= 2 * step:
+            if not np.all(roi == [255, 255, 255]):
+                upper_region = screen[tail_y - 2 * step:tail_y, left_x:right_x]
+                if np.all(upper_region == [255, 255, 255]):
+                    return head_y, tail_y
+            else:
+                head_y = tail_y
+    return None
+
+
+def _legacy_find_blocks(screen, rect, step, unexpected_colors):
+    """用原实现逐句查找整页的句子: 找到一句后把它标记为已读的颜色再继续"""
+    image = screen.copy()
+    blocks = []
+    while True:
+        block = _legacy_find_block(image, rect, step, unexpected_colors)
+        if block is None:
+            return blocks
+        blocks.append(block)
+        roi = image[block[0]:block[1], rect['left']:rect['right']]
+        roi[np.any(roi != 255, axis=2)] = unexpected_colors[1]
+
+
+def _load_golden(path):
+    """读取保存的跟读页面截图及期望结果(expected.json)，返回[(文件名, 截图, 期望结果或None), ...]"""
+    expected = {}
+    index_path = os.path.join(path, 'expected.json')
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            expected = json.load(f)
+    samples = []
+    for name in sorted(os.listdir(path)):
+        if name.lower().endswith(('.png', '.bmp')):
+            frame = cv2.imread(os.path.join(path, name))
+            if frame is not None:
+                samples.append((name, frame, expected.get(name)))
+    return samples
+
+
+def _record_golden(path, rect, step, unexpected_colors):
+    """从设备截取当前的跟读页面，以原实现的结果作为期望结果保存"""
+    adb = _connect()
+    try:
+        frame = ScreenshotManager(adb).get_frame(force_new=True)
+    finally:
+        adb.disconnect()
+    if frame is None:
+        raise Exception("截图失败")
+    image = np.ascontiguousarray(frame.bgr)
+    os.makedirs(path, exist_ok=True)
+    name = time.strftime('follow_%Y%m%d_%H%M%S.png')
+    cv2.imwrite(os.path.join(path, name), image, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+    index_path = os.path.join(path, 'expected.json')
+    expected = {}
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            expected = json.load(f)
+    block = _legacy_find_block(image, rect, step, unexpected_colors)
+    expected[name] = {
+        'block': list(block) if block else None,
+        'blocks': [list(b) for b in _legacy_find_blocks(image, rect, step, unexpected_colors)],
+    }
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(expected, f, indent=4)
+    print(f"已保存 {name}: {expected[name]}")
+
+
+def _check_golden(samples, segmenter, rect, step, unexpected_colors):
+    """检查分割器在保存的截图上与原实现及期望结果一致"""
+    for name, frame, expected in samples:
+        legacy = _legacy_find_block(frame, rect, step, unexpected_colors)
+        legacy_blocks = _legacy_find_blocks(frame, rect, step, unexpected_colors)
+        if expected is not None:
+            assert list(legacy or []) == list(expected['block'] or []), f"{name}: 原实现的结果与期望不符 {legacy}"
+            assert [list(b) for b in legacy_blocks] == expected['blocks'], f"{name}: 原实现的整页结果与期望不符"
+        block = segmenter.find_block(frame)
+        assert block == legacy, f"{name}: 分割器={block}, 原实现={legacy}"
+        blocks = segmenter.find_blocks(frame)
+        assert blocks == legacy_blocks, f"{name}: 整页查找 分割器={blocks}, 原实现={legacy_blocks}"
+        segmenter.reset()
+        assert segmenter.track(frame) == legacy, f"{name}: 逐句查找的结果与原实现不符"
+    print(f"保存的 {len(samples)} 帧截图结果正确")
+
+
+def _synthetic_frames(rect, unexpected_colors, count=20):
+    """生成模拟跟读页面的截图: 白底上若干段文字，部分段落带有已读的颜色"""
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(count):
+        image = np.full((1600, 900, 3), 255, dtype=np.uint8)
+        y = rect['top'] + int(rng.integers(0, 40))
+        while y < rect['bottom']:
+            lines = int(rng.integers(1, 4))
+            color = (60, 60, 60)
+            if rng.random() < 0.4:
+                color = tuple(int(c) for c in unexpected_colors[rng.integers(len(unexpected_colors))])
+            for _ in range(lines):
+                x = rect['left'] + 10
+                while x < rect['right'] - 40:
+                    width = int(rng.integers(10, 60))
+                    cv2.rectangle(image, (x, y + 4), (x + width, y + 22), color, -1)
+                    x += width + int(rng.integers(8, 16))
+                y += 30
+            y += int(rng.integers(40, 120))
+        frames.append(image)
+    return frames
+
+
+def _reading_sequence(frame, rect, step, unexpected_colors, scroll=58):
+    """模拟逐句朗读: 每读完一句就把该句文字改为已读的颜色，读到一半时页面向上滚动scroll像素"""
+    image = frame.copy()
+    frames = []
+    while True:
+        frames.append(image.copy())
+        block = _legacy_find_block(image, rect, step, unexpected_colors)
+        if block is None:
+            break
+        roi = image[block[0]:block[1], rect['left']:rect['right']]
+        roi[np.any(roi != 255, axis=2)] = unexpected_colors[1]
+    for frame in frames[len(frames) // 2:]:
+        frame[rect['top']:-scroll] = frame[rect['top'] + scroll:].copy()
+        frame[-scroll:] = 255
+    return frames
+
+
+def bench_segment(args):
+    """对比单次分类的句子分割器与逐步扩展选择框的原实现，并检查两者结果一致"""
+    from tasks.homework import HomeworkTask
+    task = HomeworkTask()
+    rect = task.follow_sentences_range
+    step = task.follow_sentences_step_height
+    colors = task.follow_unexpected_colors
+    segmenter = SentenceSegmenter(rect, step, colors)
+    path = args.path or GOLDEN_DIR
+    if args.record:
+        _record_golden(path, rect, step, colors)
+
+    # 保存的跟读页面截图: 断言结果与期望一致
+    samples = _load_golden(path)
+    assert samples, f"{path} 中没有截图"
+    _check_golden(samples, segmenter, rect, step, colors)
+
+    # 生成的截图: 数量更多，用于对比耗时
+    frames = [frame for _, frame, _ in samples] + _synthetic_frames(rect, colors)
+
+    mismatches = 0
+    for index, frame in enumerate(frames):
+        expected = _legacy_find_block(frame, rect, step, colors)
+        actual = segmenter.find_block(frame)
+        if expected != actual:
+            mismatches += 1
+            print(f"第{index}帧结果不一致: 原实现={expected}, 分割器={actual}")
+    print(f"共 {len(frames)} 帧，{mismatches} 帧结果不一致")
+    assert mismatches == 0, "单帧查找结果与原实现不一致"
+
+    _report("segment-legacy", _measure(
+        lambda: [_legacy_find_block(frame, rect, step, colors) for frame in frames], args.count))
+    _report("segment-profile", _measure(
+        lambda: [segmenter.find_block(frame) for frame in frames], args.count))
+
+    # 逐句朗读的帧序列: 检查从上一句继续查找的结果，并与每次完整查找对比耗时
+    sequences = [_reading_sequence(frame, rect, step, colors) for frame in frames]
+    expected = [[_legacy_find_block(frame, rect, step, colors) for frame in sequence] for sequence in sequences]
+    mismatches = 0
+    for index, sequence in enumerate(sequences):
+        segmenter.reset()
+        for position, frame in enumerate(sequence):
+            actual = segmenter.track(frame)
+            if actual != expected[index][position]:
+                mismatches += 1
+                print(f"第{index}组第{position}句结果不一致: 原实现={expected[index][position]}, 分割器={actual}")
+    print(f"共 {sum(len(sequence) for sequence in sequences)} 句，{mismatches} 句结果不一致")
+    assert mismatches == 0, "逐句查找结果与原实现不一致"
+
+    # 整页预取: 一次查找到的所有句子应与滚动前逐句查找的结果相同
+    mismatches = 0
+    for index, sequence in enumerate(sequences):
+        unscrolled = expected[index][:len(sequence) // 2]
+        blocks = segmenter.find_blocks(sequence[0])
+        if blocks[:len(unscrolled)] != unscrolled:
+            mismatches += 1
+            print(f"第{index}组整页查找结果不一致: 逐句={unscrolled}, 整页={blocks}")
+    print(f"共 {len(sequences)} 页，{mismatches} 页整页查找结果不一致")
+    assert mismatches == 0, "整页查找结果与原实现不一致"
+
+    def track_all():
+        for sequence in sequences:
+            segmenter.reset()
+            for frame in sequence:
+                segmenter.track(frame)
+    _report("segment-full", _measure(
+        lambda: [segmenter.find_block(frame) for sequence in sequences for frame in sequence], args.count))
+    logging.disable(logging.INFO)  # 计时时不输出滚动检测的日志
+    try:
+        _report("segment-track", _measure(track_all, args.count))
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def bench_ocr(args):
+    """对比每次启动tesseract命令行与常驻引擎的识别延迟，以及引擎池的并行吞吐"""
+    if args.path:
+        image = cv2.imread(args.path)
+    else:
+        image = np.full((150, 698, 3), 255, dtype=np.uint8)
+        cv2.putText(image, "Hello, how are you today?", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (60, 60, 60), 2)
+    binary = OCRProcessor().preprocess_image(image)
+    config = Config().get("ocr")
+    size = Config().get("ocr", "pool_size")
+
+    for name in ('pytesseract', 'tesserocr'):
+        engine = create_ocr_engine(name, config)
+        if not engine.open():
+            print(f"{name:<16} 无法打开")
+            continue
+        try:
+            print(f"{name:<16} 识别结果: {engine.recognize(binary).strip()}")
+            _report(f"ocr-{name}", _measure(lambda: engine.recognize(binary), args.count))
+        finally:
+            engine.close()
+
+        pool = OCREnginePool(lambda: create_ocr_engine(name, config), size)
+        with ThreadPoolExecutor(max_workers=size) as executor:
+            # 按单张图片折算
+            rate, cpu_ms, wall_ms = _measure(
+                lambda: list(executor.map(pool.recognize, [binary] * size)), args.count)
+            _report(f"ocr-{name}-x{size}", (rate * size, cpu_ms / size, wall_ms / size))
+        pool.close()
+
+
+def bench_locate(args):
+    """测试模板定位元素的耗时(首次匹配与按画面状态缓存)，在基准分辨率和1080x1920下各测一次"""
+    import tempfile
+    from .frame_source import Frame
+    with tempfile.TemporaryDirectory() as template_dir:
+        locator = UILocator(template_dir, base_resolution=(900, 1600))
+        base_width, base_height = locator.base_resolution
+        element = {'description': '测试按钮', 'type': 'position', 'template': 'button', 'x': 450, 'y': 1430}
+        for width, height in ((base_width, base_height), (1080, 1920)):
+            # 在画面中画一个按钮，模板取自基准分辨率的画面
+            def draw(w, h):
+                image = np.full((h, w, 3), 240, dtype=np.uint8)
+                x, y = locator.scale_point(element['x'] + 12, element['y'] - 6, (w, h))
+                rx, ry = locator.scale_point(90, 40, (w, h))
+                cv2.rectangle(image, (x - rx, y - ry), (x + rx, y + ry), (67, 57, 255), -1)
+                cv2.putText(image, "STOP", (x - rx // 2, y + ry // 3), cv2.FONT_HERSHEY_SIMPLEX, rx / 80, (255, 255, 255), 2)
+                return image
+            if not os.path.exists(os.path.join(template_dir, 'button.png')):
+                base = draw(base_width, base_height)
+                cv2.imwrite(os.path.join(template_dir, 'button.png'), base[1374:1474, 352:572])
+            frame = Frame(draw(width, height), 'BGR')
+            print(f"{width}x{height} 定位结果: {locator.locate(frame, element)}")
+            _report(f"locate-{width}", _measure(lambda: locator.locate(frame, element), args.count))
+            _report(f"locate-{width}-memo", _measure(lambda: locator.locate(frame, element, 'test'), args.count))
+
+
+def bench_tts(args):
+    """按句子长度对比各语音合成引擎的延迟(不使用缓存)"""
+    config = Config().get("tts")
+    lang = Config().get("tts", "language")
+    sentences = {
+        'short': "Good morning.",
+        'medium': "Could you tell me the way to the nearest library, please?",
+        'long': ("When I was young, my grandfather often took me to the river near our village, "
+                 "where we spent whole afternoons fishing and talking about the world."),
+    }
+    for name in ('gtts', 'espeak'):
+        engine = create_tts_engine(name, config)
+        try:
+            engine.synthesize("Hello.", lang)
+        except Exception as e:
+            print(f"{name:<16} 无法使用: {str(e)}")
+            continue
+        for length, text in sentences.items():
+            _report(f"tts-{name}-{length}", _measure(lambda: engine.synthesize(text, lang), args.count))
+
+
+def _dominant_frequency(pcm, rate):
+    spectrum = np.abs(np.fft.rfft(pcm * np.hanning(len(pcm))))
+    return np.argmax(spectrum) * rate / len(pcm)
+
+
+def bench_stretch(args):
+    """检查变速不变调与静音裁剪的结果，并测量处理3秒语音的耗时"""
+    rate = 24000
+    t = np.arange(rate * 3) / rate
+    # 两段带谐波的"元音"，中间和两端是静音
+    tone = (0.3 * np.sin(2 * np.pi * 220 * t) + 0.1 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    tone[:rate // 2] = 0
+    tone[int(rate * 1.4):int(rate * 1.6)] = 0
+    tone[-rate // 2:] = 0
+
+    trimmed = trim_silence(tone, rate, -40, 0.05)
+    assert abs(len(trimmed) / rate - 2.1) < 0.02, f"静音裁剪后的时长不正确: {len(trimmed) / rate:.2f} 秒"
+    for tempo in (0.8, 1.25, 1.5):
+        stretched = time_stretch(trimmed, rate, tempo)
+        expected = len(trimmed) / tempo
+        assert abs(len(stretched) - expected) <= rate * 0.01, f"tempo {tempo} 的时长不正确"
+        voiced = stretched[int(rate * 0.1):int(rate * 0.5)]
+        frequency = _dominant_frequency(voiced, rate)
+        assert abs(frequency - 220) < 5, f"tempo {tempo} 改变了音调: {frequency:.1f} Hz"
+    print("变速与静音裁剪结果正确")
+
+    for tempo in (1.25, 1.5):
+        _report(f"stretch-{tempo}", _measure(lambda: time_stretch(tone, rate, tempo), args.count))
+    _report("trim", _measure(lambda: trim_silence(tone, rate), args.count))
+
+
+BENCHMARKS = {
+    'screencap': bench_screencap,
+    'probe': bench_probe,
+    'source': bench_source,
+    'shell': bench_shell,
+    'segment': bench_segment,
+    'ocr': bench_ocr,
+    'locate': bench_locate,
+    'tts': bench_tts,
+    'stretch': bench_stretch,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HwlloETS 性能测试")
+    parser.add_argument('name', choices=sorted(BENCHMARKS), help="要运行的测试")
+    parser.add_argument('-n', '--count', type=int, default=20, help="每项测试的重复次数")
+    parser.add_argument('--path', help="离线测试使用的截图目录(segment，默认为golden/segment)或图片(ocr)")
+    parser.add_argument('--record', action='store_true', help="segment: 先从设备截取当前跟读页面加入对照截图")
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args)
@@ -0,0 +1,83 @@
+import numpy as np
+
+
+class PixelCondition:
+    """像素条件: 所有采样点的颜色都与期望颜色相符时成立
+
+    points: [(x, y), ...]、[(x, y, color), ...] 或 [(x, y, color, tolerance), ...]，
+            后两种可以为每个点单独指定颜色和误差
+    color: 所有点共用的期望颜色(BGR)
+    tolerance: 每个通道允许的最大误差
+    """
+
+    def __init__(self, points, color=None, tolerance=0, name=None):
+        self.name = name
+        self.xs = []
+        self.ys = []
+        self.colors = []
+        self.tolerances = []
+        for point in points:
+            self.xs.append(point[0])
+            self.ys.append(point[1])
+            self.colors.append(point[2] if len(point) > 2 else color)
+            self.tolerances.append(point[3] if len(point) > 3 else tolerance)
+
+    def __len__(self):
+        return len(self.xs)
+
+
+class RegionCondition:
+    """区域条件: 矩形区域内与期望颜色相符的像素比例不低于ratio时成立"""
+
+    def __init__(self, left, top, right, bottom, color, tolerance=0, ratio=1.0, name=None):
+        self.name = name
+        self.left, self.top, self.right, self.bottom = left, top, right, bottom
+        self.color = np.array(color, dtype=np.int16)
+        self.tolerance = tolerance
+        self.ratio = ratio
+
+    def evaluate(self, image, tolerance=0):
+        """tolerance: 帧的最小颜色误差(有损来源)"""
+        region = image[self.top:self.bottom, self.left:self.right].astype(np.int16)
+        matched = np.all(np.abs(region - self.color) <= max(self.tolerance, tolerance), axis=2)
+        return matched.mean() >= self.ratio if matched.size else False
+
+
+class ConditionSet:
+    """把多个条件编译为一次向量化的取色与比较
+
+    所有PixelCondition的采样点合并为一组坐标数组，每帧只做一次花式索引；
+    RegionCondition和普通函数(frame -> bool)逐个求值。
+    """
+
+    def __init__(self, conditions):
+        self.conditions = list(conditions)
+        pixel_indices = [i for i, c in enumerate(self.conditions) if isinstance(c, PixelCondition)]
+        self._pixel_indices = np.array(pixel_indices, dtype=np.intp)
+        pixel_conditions = [self.conditions[i] for i in pixel_indices]
+
+        if pixel_conditions:
+            self._xs = np.concatenate([c.xs for c in pixel_conditions]).astype(np.intp)
+            self._ys = np.concatenate([c.ys for c in pixel_conditions]).astype(np.intp)
+            self._colors = np.concatenate([c.colors for c in pixel_conditions]).astype(np.int16)
+            self._tolerances = np.concatenate([c.tolerances for c in pixel_conditions]).astype(np.int16)
+            # 每个条件在合并数组中的起始位置，用于按条件归约
+            self._starts = np.cumsum([0] + [len(c) for c in pixel_conditions[:-1]])
+        self._others = [(i, c) for i, c in enumerate(self.conditions) if not isinstance(c, PixelCondition)]
+
+    def evaluate(self, frame):
+        """返回每个条件是否成立的布尔数组"""
+        image = frame.bgr
+        result = np.zeros(len(self.conditions), dtype=bool)
+        if len(self._pixel_indices):
+            pixels = image[self._ys, self._xs].astype(np.int16)
+            # 有损来源的帧至少使用帧自带的误差
+            tolerances = np.maximum(self._tolerances, frame.tolerance) if frame.tolerance else self._tolerances
+            matched = np.all(np.abs(pixels - self._colors) <= tolerances[:, None], axis=1)
+            result[self._pixel_indices] = np.logical_and.reduceat(matched, self._starts)
+        for index, condition in self._others:
+            if isinstance(condition, RegionCondition):
+                result[index] = condition.evaluate(image, frame.tolerance)
+            else:
+                result[index] = bool(condition(frame))
+        return result
@@ -8,17 +8,68 @@ class Config:
     DEFAULT_CONFIG = {
         "adb": {
             "host": "127.0.0.1",
-            "port": 16384
+            "port": 16384,
+            "persistent_shell": True,
+            "command_timeout": 10,
+            "max_concurrency": 4,
+            "keepalive_interval": 5,
+            "keepalive_timeout": 2,
+            "reconnect_attempts": 4,
+            "reconnect_max_delay": 4
         },
         "screenshot": {
-            "fps": 5
+            "fps": 5,
+            "mode": "raw",
+            "source": "screencap"
         },
         "tts": {
-            "language": "en"
+            "language": "en",
+            "output_device": "CABLE Input",
+            "cache_size": 256,
+            "engine": "gtts",
+            "voice": "",
+            "espeak_cmd": "espeak-ng",
+            "rate": None,
+            "workers": 2,
+            "blocksize": 256,
+            "latency": "low",
+            "tempo": 1.0,
+            "trim_silence": False,
+            "silence_threshold": -40,
+            "silence_padding": 0.05
         },
         "ocr": {
             "language": "eng",
-            "tesseract_cmd": r"D:\Program Files\Tesseract-OCR\tesseract.exe"
+            "tesseract_cmd": r"D:\Program Files\Tesseract-OCR\tesseract.exe",
+            "cache": True,
+            "cache_size": 256,
+            "cache_disk_size": 32,
+            "cache_tolerance": 0.01,
+            "engine": "auto",
+            "pool_size": 2,
+            "tessdata": ""
+        },
+        "navigation": {
+            "timeout": 10,
+            "settle_frames": 2,
+            "settle_threshold": 1.0,
+            "settle_time": 0.5,
+            "change_grace": 1.0,
+            "poll_interval": 0.2
+        },
+        "locator": {
+            "base_resolution": None,
+            "threshold": 0.8,
+            "search_radius": 100
+        },
+        "fleet": {
+            "enabled": False,
+            "devices": [],
+            "auto_discover": True,
+            "discover_base": 16384,
+            "discover_step": 32,
+            "discover_count": 8,
+            "max_workers": 0
         }
     }
 
@@ -56,10 +107,14 @@ class Config:
             self.logger.error(f"保存配置文件失败: {str(e)}")
             return False
 
-    def get(self, section, key=None):
+    def get(self, section, key=None, default=None):
         if key is None:
             return self.config.get(section, {})
-        return self.config.get(section, {}).get(key)
+        value = self.config.get(section, {}).get(key)
+        if value is None:
+            # 旧配置文件中可能缺少新增的配置项，回退到默认配置
+            value = self.DEFAULT_CONFIG.get(section, {}).get(key, default)
+        return value
 
     def set(self, section, key, value):
         if section not in self.config:
@@ -1,8 +1,11 @@
 import cv2
 import numpy as np
+import os
+import time
 from .screenshot import ScreenshotManager
 from .config import Config
 from .adb import ADBController
+from .locator import TEMPLATE_DIR
 
 class DebugTool:
     def __init__(self):
@@ -16,6 +19,7 @@ class DebugTool:
     def get_element_position(self, window_name="Debug Tool"):
         """交互式获取UI元素位置"""
         self.points = []
+        last_image = None
         
         def on_mouse(event, x, y, flags, param):
             if event == cv2.EVENT_LBUTTONDOWN:
@@ -31,6 +35,7 @@ class DebugTool:
         while True:
             image = self.screenshot.get_screenshot(force_new=True)
             if image is not None:
+                last_image = image
                 # 缩放图像
                 display_image = cv2.resize(image, None, fx=self.scale, fy=self.scale)
                 
@@ -52,6 +57,8 @@ class DebugTool:
                 break
             elif key == ord('c'):  # 按c清除点
                 self.points = []
+            elif key == ord('t') and len(self.points) >= 2 and last_image is not None:  # 按t保存模板
+                self.save_template(last_image, self.points[-2], self.points[-1])
             elif key == ord('+') or key == ord('='):  # 按+增大缩放
                 self.scale = min(1.0, self.scale + 0.1)
             elif key == ord('-'):  # 按-减小缩放
@@ -60,12 +67,26 @@ class DebugTool:
         cv2.destroyAllWindows()
         return self.points
 
+    def save_template(self, image, corner1, corner2):
+        """把两个点围成的矩形保存为元素模板"""
+        left, right = sorted((corner1[0], corner2[0]))
+        top, bottom = sorted((corner1[1], corner2[1]))
+        if right - left < 4 or bottom - top < 4:
+            print("模板区域过小")
+            return None
+        os.makedirs(TEMPLATE_DIR, exist_ok=True)
+        path = os.path.join(TEMPLATE_DIR, f"template_{int(time.time())}.png")
+        cv2.imwrite(path, image[top:bottom, left:right])
+        print(f"模板已保存: {path}，请重命名为元素的template名称，中心坐标: x={(left + right) // 2}, y={(top + bottom) // 2}")
+        return path
+
 if __name__ == "__main__":
     # 调试代码示例
     tool = DebugTool()
     print("操作说明：")
     print("- 点击鼠标左键记录位置")
     print("- 按c清除所有点")
+    print("- 按t把最后两个点围成的矩形保存为元素模板")
     print("- 按+/-调整窗口大小")
     print("- 按q退出程序")
     positions = tool.get_element_position()
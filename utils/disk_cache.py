@@ -0,0 +1,133 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from .log import Logger
+
+
+class DiskLRU:
+    """磁盘缓存的索引: 记录每个文件的大小和最近使用时间，超过大小上限时删除最久未用的文件
+
+    每个键对应缓存目录中的一个文件<键><suffix>，索引保存在index.json中。
+    文件和索引都先写到临时文件再原子地替换到位，多个线程或进程同时写入也不会得到损坏的文件。
+    多个进程共用一个目录时，保存索引前先合并其他进程写入的项；索引中缺少的文件在加载时收回(只有大小和时间)，
+    所有文件都计入大小上限。
+    读取时更新的使用时间按flush_interval秒节流保存，进程退出时保存剩余的修改，下次启动仍按最近使用淘汰。
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, cache_dir, max_size, suffix='.npy', flush_interval=30, name="缓存"):
+        self.logger = Logger().get_logger()
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.suffix = suffix
+        self.flush_interval = flush_interval
+        self.name = name
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._saved_at = time.time()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.entries = self._load()
+        atexit.register(self.flush)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}{self.suffix}")
+
+    def temp_path(self, suffix=None):
+        """返回一个不会与其他写入者冲突的临时文件路径"""
+        return os.path.join(self.cache_dir, f".{uuid.uuid4().hex}.tmp{self.suffix if suffix is None else suffix}")
+
+    def write(self, path, write, mode='wb', **kwargs):
+        """原子地写入文件: write(f)写入临时文件，完成后替换到path"""
+        temp = self.temp_path(os.path.splitext(path)[1])
+        try:
+            with open(temp, mode, **kwargs) as f:
+                write(f)
+            os.replace(temp, path)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+    def _read_index(self):
+        """读取磁盘上的索引，只保留文件仍存在的项"""
+        try:
+            with open(os.path.join(self.cache_dir, self.INDEX_FILE), 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            self.logger.error(f"加载{self.name}索引失败: {str(e)}")
+            return {}
+        return {key: entry for key, entry in entries.items() if os.path.exists(self.path(key))}
+
+    def _load(self):
+        entries = self._read_index()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith('.'):
+                # 清理中途退出遗留的临时文件
+                if '.tmp' in name and time.time() - os.path.getmtime(path) > 3600:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            elif name.endswith(self.suffix):
+                # 收回索引中缺少的文件(其他进程保存索引时可能覆盖)，使其也参与淘汰
+                key = name[:-len(self.suffix)]
+                if key not in entries:
+                    entries[key] = {'size': os.path.getsize(path), 'used': os.path.getmtime(path)}
+        return entries
+
+    def save(self):
+        with self._lock:
+            try:
+                # 合并其他进程在此期间写入的项，避免覆盖后丢失
+                for key, entry in self._read_index().items():
+                    self.entries.setdefault(key, entry)
+                self.write(os.path.join(self.cache_dir, self.INDEX_FILE),
+                           lambda f: json.dump(self.entries, f, ensure_ascii=False), mode='w', encoding='utf-8')
+                self._dirty = False
+                self._saved_at = time.time()
+            except Exception as e:
+                self.logger.error(f"保存{self.name}索引失败: {str(e)}")
+
+    def flush(self):
+        """保存尚未写入的使用时间"""
+        if self._dirty:
+            self.save()
+
+    def touch(self, key):
+        """记录一次读取，按节流间隔保存索引"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+            entry['used'] = time.time()
+            self._dirty = True
+            if time.time() - self._saved_at >= self.flush_interval:
+                self.save()
+
+    def add(self, key, entry):
+        """登记已写入的文件(entry中需要有size)，超过大小上限时淘汰最久未用的文件"""
+        with self._lock:
+            self.entries[key] = dict(entry, used=time.time())
+            self.evict(keep=key)
+            self.save()
+
+    def evict(self, keep=None):
+        """超过大小上限时删除最久未用的文件"""
+        with self._lock:
+            total = sum(entry['size'] for entry in self.entries.values())
+            for key in sorted(self.entries, key=lambda k: self.entries[k].get('used', 0)):
+                if total <= self.max_size:
+                    break
+                if key == keep:
+                    continue
+                total -= self.entries.pop(key)['size']
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    pass
@@ -0,0 +1,191 @@
+from PySide6.QtCore import QThread, Signal
+from queue import Empty
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import socket
+from .adb import ADBController
+from .config import Config
+from .log import Logger
+from .task_executor import run_tasks
+
+
+class DeviceRegistry:
+    """管理多台设备(模拟器)的ADB地址"""
+
+    def __init__(self):
+        self.config = Config()
+        self.logger = Logger().get_logger()
+
+    def discover(self):
+        """探测本机上的MuMu模拟器ADB端口
+
+        MuMu的多开实例从16384开始，每个实例的端口间隔固定步长(默认32)。
+        """
+        host = self.config.get("adb", "host")
+        base = self.config.get("fleet", "discover_base")
+        step = self.config.get("fleet", "discover_step")
+        found = []
+        for index in range(self.config.get("fleet", "discover_count")):
+            port = base + index * step
+            try:
+                with socket.create_connection((host, port), timeout=0.2):
+                    found.append((host, port))
+            except OSError:
+                continue
+        self.logger.info(f"发现 {len(found)} 台设备: {', '.join(f'{h}:{p}' for h, p in found)}")
+        return found
+
+    def _configured(self):
+        """配置中列出的设备 [(host, port, 音频输出设备名), ...]
+
+        每一项可以是"host:port"、端口号，或{"address": "host:port", "output_device": "CABLE-A Input"}，
+        output_device为该设备的虚拟麦克风对应的输出设备名称(包含即可)。
+        """
+        devices = []
+        for item in self.config.get("fleet", "devices"):
+            output_device = None
+            if isinstance(item, dict):
+                output_device = item.get('output_device') or None
+                item = item.get('address', '')
+            host, _, port = str(item).rpartition(':')
+            devices.append((host or self.config.get("adb", "host"), int(port), output_device))
+        return devices
+
+    def output_devices(self):
+        """返回配置了单独音频输出设备的设备 {"host:port": 输出设备名}"""
+        return {f"{host}:{port}": output for host, port, output in self._configured() if output}
+
+    def list_devices(self):
+        """返回所有设备地址 [(host, port), ...]
+
+        包括配置中列出的设备以及自动发现的设备，都没有时使用adb配置中的单台设备。
+        """
+        endpoints = [(host, port) for host, port, _ in self._configured()]
+        if self.config.get("fleet", "auto_discover"):
+            for endpoint in self.discover():
+                if endpoint not in endpoints:
+                    endpoints.append(endpoint)
+        if not endpoints:
+            endpoints.append((self.config.get("adb", "host"), self.config.get("adb", "port")))
+        return endpoints
+
+
+class _QueueLogHandler(logging.Handler):
+    """把工作进程中的日志转发给主进程"""
+
+    def __init__(self, queue, device):
+        super().__init__()
+        self.queue = queue
+        self.device = device
+
+    def emit(self, record):
+        self.queue.put(('log', self.device, record.levelno, record.getMessage()))
+
+
+def _worker_main(host, port, task_specs, queue, output_device=None):
+    """工作进程入口: 为一台设备独立执行完整的任务流程
+    output_device: 该设备使用的音频输出设备名，只在本进程中覆盖tts.output_device
+    """
+    device = f"{host}:{port}"
+    logger = Logger().get_logger()
+    handler = _QueueLogHandler(queue, device)
+    handler.setLevel(logging.INFO)
+    logger.addHandler(handler)
+    if output_device:
+        # 只修改内存中的配置，Config().set会写回config.json
+        Config().config.setdefault("tts", {})["output_device"] = output_device
+
+    adb_controller = ADBController(host, port)
+    try:
+        tasks = [getattr(importlib.import_module(module_name), class_name)()
+                 for module_name, class_name in task_specs]
+        asyncio.run(run_tasks(tasks, adb_controller, lambda: True,
+                              lambda name, success: queue.put(('task', device, name, success))))
+    except Exception as e:
+        logger.error(f"设备任务执行出错: {str(e)}")
+    finally:
+        adb_controller.disconnect()
+        queue.put(('done', device))
+
+
+class FleetRunner(QThread):
+    """在多个工作进程中并行地为每台设备执行任务"""
+    task_completed = Signal(str, str, bool)  # 设备, 任务名, 是否成功
+    device_completed = Signal(str)
+    all_tasks_completed = Signal()
+
+    def __init__(self, tasks, endpoints, output_devices=None):
+        super().__init__()
+        # 任务实例不能跨进程传递，只传递类的位置，由工作进程重新创建
+        self.task_specs = [(task.__class__.__module__, task.__class__.__name__) for task in tasks]
+        self.endpoints = list(endpoints)
+        self.output_devices = output_devices or {}  # "host:port" -> 音频输出设备名
+        self.max_workers = Config().get("fleet", "max_workers") or os.cpu_count() or 1
+        self.logger = Logger().get_logger()
+        if any(getattr(task, 'uses_audio', False) for task in tasks) and not self._outputs_separated():
+            # 多台设备的语音从同一个输出设备播放会互相干扰，只能逐台执行
+            self.max_workers = 1
+        self._processes = {}
+        self._running = True
+
+    def _outputs_separated(self):
+        """每台设备是否都配置了各不相同的音频输出设备"""
+        if len(self.endpoints) <= 1:
+            return True
+        outputs = [self.output_devices.get(f"{host}:{port}") for host, port in self.endpoints]
+        if None in outputs or len(set(outputs)) < len(outputs):
+            self.logger.warning("任务需要播放语音，但并非每台设备都在fleet.devices中配置了单独的output_device，"
+                                "将逐台执行以免语音互相干扰")
+            return False
+        return True
+
+    def stop(self):
+        self._running = False
+        self.logger.info("正在停止所有设备的任务...")
+        for process in list(self._processes.values()):
+            process.terminate()
+        self.wait()
+        self.all_tasks_completed.emit()
+
+    def run(self):
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        pending = list(self.endpoints)
+        self.logger.info(f"开始在 {len(pending)} 台设备上执行任务 (最多 {self.max_workers} 个并行进程)")
+
+        while self._running and (pending or self._processes):
+            # 按并行上限启动新的工作进程
+            while pending and len(self._processes) < self.max_workers:
+                host, port = pending.pop(0)
+                output_device = self.output_devices.get(f"{host}:{port}")
+                process = context.Process(target=_worker_main,
+                                          args=(host, port, self.task_specs, queue, output_device),
+                                          name=f"HwlloETS-{host}:{port}", daemon=True)
+                process.start()
+                self._processes[f"{host}:{port}"] = process
+
+            try:
+                message = queue.get(timeout=0.5)
+            except Empty:
+                # 处理异常退出(没有发送结束消息)的进程
+                for device, process in list(self._processes.items()):
+                    if not process.is_alive() and process.exitcode != 0:
+                        self.logger.error(f"[{device}] 工作进程异常退出 (exitcode={process.exitcode})")
+                        self._processes.pop(device)
+                        self.device_completed.emit(device)
+                continue
+
+            kind, device = message[0], message[1]
+            if kind == 'log':
+                self.logger.log(message[2], f"[{device}] {message[3]}")
+            elif kind == 'task':
+                self.task_completed.emit(device, message[2], message[3])
+            elif kind == 'done' and device in self._processes:
+                self._processes.pop(device).join(timeout=5)
+                self.device_completed.emit(device)
+
+        if self._running:  # 只有在正常结束时才发送信号
+            self.all_tasks_completed.emit()
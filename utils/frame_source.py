@@ -0,0 +1,327 @@
+import os
+import socket
+import struct
+import threading
+import time
+from abc import ABC, abstractmethod
+from PIL import Image
+import io
+import numpy as np
+import cv2
+from .adb import ADBController
+from .log import Logger
+
+# screencap原始输出中的像素格式 (android PixelFormat)
+RAW_PIXEL_FORMATS = {
+    1: 'RGBA',  # RGBA_8888
+    2: 'RGBX',  # RGBX_8888
+    5: 'BGRA',  # BGRA_8888
+}
+
+
+class Frame:
+    """一帧截图
+
+    原始模式下像素是对screencap输出的np.frombuffer视图(只读)，
+    各通道的访问均通过切片完成，不产生额外拷贝。
+    有损来源(视频流)的帧带有最小颜色误差tolerance，取色比较时每个通道至少允许这么大的误差。
+    """
+
+    def __init__(self, pixels, order, timestamp=None, tolerance=0):
+        self.pixels = pixels  # (h, w, c) 的像素数组
+        self.order = order    # 通道顺序: 'RGBA' / 'RGBX' / 'BGRA' / 'BGR'
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.tolerance = tolerance  # 最小颜色误差，无损截图为0
+        self.seq = 0  # 帧序号，由ScreenshotManager在发布时分配
+
+    @property
+    def width(self):
+        return self.pixels.shape[1]
+
+    @property
+    def height(self):
+        return self.pixels.shape[0]
+
+    @property
+    def bgr(self):
+        """BGR格式的视图(与OpenCV一致)"""
+        if self.order == 'BGR':
+            return self.pixels
+        if self.order == 'BGRA':
+            return self.pixels[..., :3]
+        return self.pixels[..., 2::-1]
+
+    @property
+    def rgba(self):
+        """RGBA格式的像素，非RGBA来源时需要转换(会产生拷贝)"""
+        if self.order in ('RGBA', 'RGBX'):
+            return self.pixels
+        if self.order == 'BGRA':
+            return self.pixels[..., [2, 1, 0, 3]]
+        return cv2.cvtColor(self.pixels, cv2.COLOR_BGR2RGBA)
+
+    def channel(self, name):
+        """按名称('R'/'G'/'B'/'A')获取单个通道的视图"""
+        order = 'BGR' if self.order == 'BGR' else self.order.replace('X', 'A')
+        return self.pixels[..., order.index(name)]
+
+    @classmethod
+    def from_raw(cls, data, timestamp=None):
+        """解析screencap的原始输出
+
+        头部为小端的 width, height, format (Android 8以后还有一个colorspace字段)，
+        之后紧跟着逐行排列的像素数据。
+        """
+        if len(data) < 12:
+            raise ValueError("原始截图数据过短")
+        width, height, pixel_format = struct.unpack_from('<3I', data, 0)
+        order = RAW_PIXEL_FORMATS.get(pixel_format)
+        if order is None:
+            raise ValueError(f"不支持的像素格式: {pixel_format}")
+        size = width * height * 4
+        # 根据数据长度推断头部大小(12或16字节)
+        header_size = len(data) - size
+        if header_size not in (12, 16):
+            raise ValueError(f"原始截图数据长度异常: {len(data)} ({width}x{height})")
+        pixels = np.frombuffer(data, dtype=np.uint8, count=size, offset=header_size)
+        return cls(pixels.reshape(height, width, 4), order, timestamp)
+
+    @classmethod
+    def from_png(cls, data, timestamp=None):
+        """解码PNG截图(兼容模式)"""
+        image = Image.open(io.BytesIO(data))
+        # 转换为OpenCV格式
+        cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+        return cls(cv_image, 'BGR', timestamp)
+
+
+class FrameSource(ABC):
+    """截图来源的基类
+
+    realtime为True的来源会自行等待新帧(read的timeout参数)，
+    后台截图线程不需要再额外按fps休眠。
+    """
+    name = "未命名来源"
+    realtime = False
+
+    def __init__(self):
+        self.logger = Logger().get_logger()
+
+    def open(self):
+        """打开来源，成功返回True"""
+        return True
+
+    @abstractmethod
+    def read(self, timeout=None):
+        """读取一帧，失败时返回None"""
+        pass
+
+    def close(self):
+        """关闭来源"""
+        pass
+
+
+class ScreencapSource(FrameSource):
+    """通过单次screencap命令截图"""
+    name = "screencap"
+
+    def __init__(self, adb_controller: ADBController, mode='raw'):
+        super().__init__()
+        self.adb = adb_controller
+        self.mode = mode  # raw 或 png
+
+    def read(self, timeout=None):
+        raw = self.mode == 'raw'
+        screenshot_bytes = self.adb.screencap(raw=raw)
+        if not screenshot_bytes:
+            return None
+        try:
+            if raw:
+                return Frame.from_raw(screenshot_bytes)
+            return Frame.from_png(screenshot_bytes)
+        except Exception as e:
+            if raw:
+                # 设备不支持原始输出时回退到PNG
+                self.logger.warning(f"原始截图解析失败，回退到PNG模式: {str(e)}")
+                self.mode = 'png'
+                return self.read()
+            self.logger.error(f"截图处理失败: {str(e)}")
+            return None
+
+
+class H264StreamSource(FrameSource):
+    """通过screenrecord持续输出的H.264视频流截图
+
+    视频流使用独立的ADB连接读取(避免长时间占用主连接)，
+    经由本地TCP端口转交给OpenCV(FFmpeg)解码。
+    screenrecord只在画面变化时输出新帧，画面静止时read会在超时后返回上一帧。
+    解码后的帧是有损的(YUV420)，纯色也会有几个单位的偏差，帧上带有最小颜色误差tolerance，
+    使误差为0的取色条件仍然可以成立。
+    """
+    name = "h264"
+    realtime = True
+
+    def __init__(self, host=None, port=None, bit_rate=8000000, time_limit=180, tolerance=24):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.bit_rate = bit_rate
+        self.tolerance = tolerance
+        self.time_limit = time_limit  # screenrecord单次录制的最长时间(秒)，结束后自动重启
+        self.adb = None
+        self.running = False
+        self._server = None
+        self._threads = []
+        self._cond = threading.Condition()
+        self._latest = None
+        self._decoded = 0
+        self._consumed = 0
+
+    def open(self):
+        # 独立的ADB连接，连接参数与主连接相同
+        self.adb = ADBController(self.host, self.port)
+        if not self.adb.connect():
+            self.adb = None
+            return False
+
+        self._server = socket.create_server(('127.0.0.1', 0))
+        port = self._server.getsockname()[1]
+        self.running = True
+        self._threads = [
+            threading.Thread(target=self._pump, name='H264Pump', daemon=True),
+            threading.Thread(target=self._decode, args=(port,), name='H264Decode', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return True
+
+    def _pump(self):
+        """把screenrecord的输出转发到本地端口"""
+        try:
+            connection, _ = self._server.accept()
+        except OSError:
+            return
+        cmd = f'screenrecord --output-format=h264 --bit-rate {self.bit_rate} --time-limit {self.time_limit} -'
+        with connection:
+            while self.running:
+                received = False
+                # 流空闲时(画面静止)不应超时，超时时间取单次录制时长之外再留余量
+                for chunk in self.adb.streaming_shell(cmd, timeout_s=self.time_limit + 10):
+                    if not self.running:
+                        break
+                    received = True
+                    try:
+                        connection.sendall(chunk)
+                    except OSError:
+                        self.running = False
+                        break
+                if not received:
+                    # 设备不支持screenrecord或连接已断开
+                    self.running = False
+        self.logger.debug("H.264视频流已停止")
+
+    def _decode(self, port):
+        # 降低FFmpeg的缓冲延迟
+        os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "fflags;nobuffer|flags;low_delay")
+        capture = cv2.VideoCapture(f'tcp://127.0.0.1:{port}', cv2.CAP_FFMPEG)
+        try:
+            while self.running:
+                ok, image = capture.read()
+                if not ok:
+                    if self.running:
+                        self.logger.error("H.264视频流解码失败")
+                    break
+                with self._cond:
+                    self._latest = image
+                    self._decoded += 1
+                    self._cond.notify_all()
+        finally:
+            capture.release()
+            self.running = False
+            with self._cond:
+                self._cond.notify_all()
+
+    def read(self, timeout=None):
+        with self._cond:
+            if self.running and self._decoded == self._consumed:
+                self._cond.wait(timeout)
+            image = self._latest
+            self._consumed = self._decoded
+        if image is None:
+            return None
+        return Frame(image, 'BGR', tolerance=self.tolerance)
+
+    def close(self):
+        self.running = False
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        if self.adb is not None:
+            # 断开连接会让正在阻塞的视频流读取立即结束
+            self.adb.disconnect()
+            self.adb = None
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+
+class ReplaySource(FrameSource):
+    """从保存的图片目录或视频文件回放截图，用于离线调试"""
+    name = "replay"
+
+    IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, path, loop=False):
+        super().__init__()
+        self.path = path
+        self.loop = loop
+        self._files = None
+        self._index = 0
+        self._capture = None
+
+    def open(self):
+        if os.path.isdir(self.path):
+            self._files = sorted(
+                os.path.join(self.path, name) for name in os.listdir(self.path)
+                if name.lower().endswith(self.IMAGE_EXTENSIONS))
+            self._index = 0
+            return bool(self._files)
+        self._capture = cv2.VideoCapture(self.path)
+        return self._capture.isOpened()
+
+    def read(self, timeout=None):
+        if self._files is not None:
+            if self._index >= len(self._files):
+                if not self.loop:
+                    return None
+                self._index = 0
+            image = cv2.imread(self._files[self._index])
+            self._index += 1
+            return Frame(image, 'BGR') if image is not None else None
+
+        if self._capture is None:
+            return None
+        ok, image = self._capture.read()
+        if not ok and self.loop:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, image = self._capture.read()
+        return Frame(image, 'BGR') if ok else None
+
+    def close(self):
+        if self._capture is not None:
+            self._capture.release()
+            self._capture = None
+
+
+def create_frame_source(adb_controller, name, config=None):
+    """根据名称创建截图来源
+    name: screencap / h264 / replay
+    config: screenshot配置段
+    """
+    config = config or {}
+    if name == 'h264':
+        return H264StreamSource(adb_controller.host, adb_controller.port, bit_rate=config.get('bit_rate', 8000000),
+                                tolerance=config.get('h264_tolerance', 24))
+    if name == 'replay':
+        return ReplaySource(config.get('replay_path', ''), loop=config.get('replay_loop', False))
+    return ScreencapSource(adb_controller, mode=config.get('mode', 'raw'))
@@ -1,7 +1,7 @@
 from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QListWidget, QTextEdit, QPushButton, QCheckBox,
                              QListWidgetItem, QLabel, QLineEdit, QSpinBox,
-                             QGroupBox, QFormLayout)
+                             QGroupBox, QFormLayout, QComboBox)
 from PySide6.QtCore import Qt, QThread, Signal
 from PySide6.QtGui import QColor, QTextCharFormat
 import asyncio
@@ -11,6 +11,7 @@ from .log import Logger
 from .adb import ADBController
 from .config import Config
 from utils.task_executor import TaskExecutor
+from .fleet import DeviceRegistry, FleetRunner
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -20,8 +21,9 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("HwlloETS")
         self.setMinimumSize(800, 600)
         
-        # 初始化ADB控制器(但不自动连接)
+        # 初始化ADB控制器，在后台预先连接并保持连接
         self.adb_controller = ADBController()
+        self.adb_controller.start_keepalive()
         
         # 主布局
         main_widget = QWidget()
@@ -34,7 +36,9 @@ class MainWindow(QMainWindow):
         self.task_list = QListWidget()
         self.start_button = QPushButton("开始执行")
         self.start_button.clicked.connect(self.start_tasks)
+        self.progress_label = QLabel("")
         left_layout.addWidget(self.task_list)
+        left_layout.addWidget(self.progress_label)
         left_layout.addWidget(self.start_button)
         layout.addWidget(left_widget, 1)
         
@@ -55,6 +59,10 @@ class MainWindow(QMainWindow):
         self.adb_port.setValue(Config().get("adb", "port"))
         adb_form.addRow("主机:", self.adb_host)
         adb_form.addRow("端口:", self.adb_port)
+        self.fleet_enabled = QCheckBox("多设备并行")
+        self.fleet_enabled.setToolTip("在配置的设备和自动发现的MuMu模拟器上同时执行任务")
+        self.fleet_enabled.setChecked(Config().get("fleet", "enabled"))
+        adb_form.addRow(self.fleet_enabled)
         
         # 截图配置组
         screenshot_group = QGroupBox("截图配置")
@@ -63,6 +71,14 @@ class MainWindow(QMainWindow):
         self.screenshot_fps.setRange(1, 30)
         self.screenshot_fps.setValue(Config().get("screenshot", "fps"))
         screenshot_form.addRow("FPS:", self.screenshot_fps)
+        self.screenshot_mode = QComboBox()
+        self.screenshot_mode.addItems(["raw", "png"])
+        self.screenshot_mode.setCurrentText(Config().get("screenshot", "mode"))
+        screenshot_form.addRow("模式:", self.screenshot_mode)
+        self.screenshot_source = QComboBox()
+        self.screenshot_source.addItems(["screencap", "h264", "replay"])
+        self.screenshot_source.setCurrentText(Config().get("screenshot", "source"))
+        screenshot_form.addRow("来源:", self.screenshot_source)
 
         # TTS配置组
         tts_group = QGroupBox("TTS配置")
@@ -171,8 +187,21 @@ class MainWindow(QMainWindow):
             if selected_tasks:
                 self.running = True
                 self.start_button.setText("停止执行")
-                self.executor = TaskExecutor(selected_tasks, self.adb_controller)
-                self.executor.task_completed.connect(self.on_task_completed)
+                if Config().get("fleet", "enabled"):
+                    registry = DeviceRegistry()
+                    endpoints = registry.list_devices()
+                    self.executor = FleetRunner(selected_tasks, endpoints, registry.output_devices())
+                    self.executor.task_completed.connect(self.on_fleet_task_completed)
+                    self.executor.device_completed.connect(self.on_device_completed)
+                else:
+                    endpoints = [None]
+                    self.executor = TaskExecutor(selected_tasks, self.adb_controller)
+                    self.executor.task_completed.connect(self.on_task_completed)
+                self.progress = {
+                    'devices': len(endpoints), 'devices_done': 0,
+                    'tasks': len(endpoints) * len(selected_tasks), 'tasks_done': 0, 'failed': 0
+                }
+                self.update_progress()
                 self.executor.all_tasks_completed.connect(self.on_all_tasks_completed)
                 self.executor.start()
         else:
@@ -194,9 +223,35 @@ class MainWindow(QMainWindow):
             self.start_button.setText("开始执行")
             self.start_button.setEnabled(True)
 
+    def update_progress(self):
+        progress = self.progress
+        text = f"任务进度: {progress['tasks_done']}/{progress['tasks']}"
+        if progress['failed']:
+            text += f" (失败 {progress['failed']})"
+        if progress['devices'] > 1:
+            text = f"设备: {progress['devices_done']}/{progress['devices']}  " + text
+        self.progress_label.setText(text)
+
     def on_task_completed(self, task_name, success):
         status = "成功" if success else "失败"
         Logger().get_logger().info(f"任务 {task_name} 执行{status}")
+        self.progress['tasks_done'] += 1
+        if not success:
+            self.progress['failed'] += 1
+        self.update_progress()
+
+    def on_fleet_task_completed(self, device, task_name, success):
+        status = "成功" if success else "失败"
+        Logger().get_logger().info(f"[{device}] 任务 {task_name} 执行{status}")
+        self.progress['tasks_done'] += 1
+        if not success:
+            self.progress['failed'] += 1
+        self.update_progress()
+
+    def on_device_completed(self, device):
+        Logger().get_logger().info(f"[{device}] 所有任务执行完成")
+        self.progress['devices_done'] += 1
+        self.update_progress()
 
     def on_all_tasks_completed(self):
         try:
@@ -218,7 +273,10 @@ class MainWindow(QMainWindow):
         config = Config()
         config.set("adb", "host", self.adb_host.text())
         config.set("adb", "port", self.adb_port.value())
+        config.set("fleet", "enabled", self.fleet_enabled.isChecked())
         config.set("screenshot", "fps", self.screenshot_fps.value())
+        config.set("screenshot", "mode", self.screenshot_mode.currentText())
+        config.set("screenshot", "source", self.screenshot_source.currentText())
         config.set("tts", "language", self.tts_language.text())
         config.set("ocr", "language", self.ocr_language.text())
         config.set("ocr", "tesseract_cmd", self.ocr_tesseract.text())
@@ -227,8 +285,8 @@ class MainWindow(QMainWindow):
 
     def connect_adb(self):
         try:
-            self.adb_controller = ADBController()
-            if self.adb_controller.connect():
+            # 复用同一个控制器，按新的配置重新连接
+            if self.adb_controller.reconnect():
                 Logger().get_logger().info("ADB连接成功")
             else:
                 Logger().get_logger().error("ADB连接失败")
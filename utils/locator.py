@@ -0,0 +1,154 @@
+import os
+import cv2
+import numpy as np
+from .config import Config
+from .log import Logger
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
+
+
+class UILocator:
+    """通过模板匹配定位界面元素
+
+    元素沿用任务中的位置字典 {'description', 'type': 'position', 'x', 'y'}，另外可以指定:
+        'template': templates目录下的模板图片名(不含扩展名，可用DebugTool按t保存)
+        'roi': 以x, y为中心的搜索半径(像素)，默认为search_radius
+    设置了locator.base_resolution时，坐标和模板视为该分辨率下截取的，按比例换算到设备分辨率；
+    未设置(默认)时坐标和模板就是设备上的实际大小，不做换算。
+    模板按设备分辨率缩放后的金字塔只生成一次；匹配到的位置按(画面状态, 元素, 分辨率)缓存。
+    没有模板或匹配度不足时，使用(换算后的)x, y。
+    """
+
+    def __init__(self, template_dir=TEMPLATE_DIR, base_resolution=None):
+        self.logger = Logger().get_logger()
+        config = Config()
+        self.template_dir = template_dir
+        base = base_resolution or config.get("locator", "base_resolution")
+        self.base_resolution = tuple(base) if base else None
+        self.threshold = config.get("locator", "threshold")
+        self.search_radius = config.get("locator", "search_radius")
+        self.scales = (0.9, 1.0, 1.1)  # 在分辨率比例附近额外尝试的缩放
+        self._templates = {}  # 模板名 -> 基准分辨率下的灰度模板(不存在时为None)
+        self._pyramids = {}  # (模板名, 宽, 高) -> [缩放后的模板, ...]
+        self._positions = {}  # (画面状态, 元素名, 宽, 高) -> (x, y)
+
+    def _factors(self, size):
+        """基准分辨率到size=(宽, 高)的缩放比例，没有基准分辨率或size时为1"""
+        if self.base_resolution is None or size is None:
+            return 1, 1
+        return size[0] / self.base_resolution[0], size[1] / self.base_resolution[1]
+
+    def scale_point(self, x, y, size):
+        """把基准分辨率下的坐标换算到size=(宽, 高)的画面，没有基准分辨率时原样返回"""
+        fx, fy = self._factors(size)
+        return round(x * fx), round(y * fy)
+
+    def scale_length(self, length, size):
+        """换算竖直方向的长度(例如文本的行高)"""
+        return max(1, round(length * self._factors(size)[1]))
+
+    def scale_rect(self, rect, size):
+        """换算range类型的矩形范围"""
+        left, top = self.scale_point(rect['left'], rect['top'], size)
+        right, bottom = self.scale_point(rect['right'], rect['bottom'], size)
+        return dict(rect, left=left, top=top, right=right, bottom=bottom)
+
+    @staticmethod
+    def _name(element):
+        return element.get('template') or element['description']
+
+    def _template(self, name):
+        if name not in self._templates:
+            path = os.path.join(self.template_dir, f"{name}.png")
+            template = cv2.imread(path, cv2.IMREAD_GRAYSCALE) if os.path.exists(path) else None
+            if template is None:
+                self.logger.debug(f"没有找到元素模板: {path}，使用记录的坐标")
+            self._templates[name] = template
+        return self._templates[name]
+
+    def _pyramid(self, name, size):
+        """取得按分辨率缩放后的一组模板[(原尺寸, 缩小一半), ...]，每个分辨率只生成一次"""
+        key = (name, size[0], size[1])
+        if key not in self._pyramids:
+            template = self._template(name)
+            pyramid = []
+            if template is not None:
+                fx, fy = self._factors(size)
+                for scale in self.scales:
+                    scaled = cv2.resize(template, None, fx=fx * scale, fy=fy * scale,
+                                        interpolation=cv2.INTER_AREA if fx * scale < 1 else cv2.INTER_LINEAR)
+                    if scaled.shape[0] >= 8 and scaled.shape[1] >= 8:
+                        pyramid.append((scaled, cv2.pyrDown(scaled)))
+            self._pyramids[key] = pyramid
+        return self._pyramids[key]
+
+    def _match(self, frame, element, size):
+        """在提示的范围内匹配模板，返回元素中心坐标，匹配度不足时返回None
+
+        先在缩小一半的画面上匹配所有缩放的模板，再用最佳的模板在原尺寸下的小范围内精确定位。
+        """
+        pyramid = self._pyramid(self._name(element), size)
+        if not pyramid:
+            return None
+        x, y = self.scale_point(element['x'], element['y'], size)
+        radius_x, radius_y = self.scale_point(element.get('roi', self.search_radius),
+                                              element.get('roi', self.search_radius), size)
+        largest = max((full for full, _ in pyramid), key=lambda t: t.size)
+        left = max(0, x - radius_x - largest.shape[1] // 2)
+        top = max(0, y - radius_y - largest.shape[0] // 2)
+        right = min(size[0], x + radius_x + largest.shape[1] // 2)
+        bottom = min(size[1], y + radius_y + largest.shape[0] // 2)
+        region = cv2.cvtColor(np.ascontiguousarray(frame.bgr[top:bottom, left:right]), cv2.COLOR_BGR2GRAY)
+        small = cv2.pyrDown(region)
+
+        # 粗匹配: 选出最佳的缩放和大致位置
+        best_score, best = -1, None
+        for full, half in pyramid:
+            if half.shape[0] > small.shape[0] or half.shape[1] > small.shape[1]:
+                continue
+            _, score, _, location = cv2.minMaxLoc(cv2.matchTemplate(small, half, cv2.TM_CCOEFF_NORMED))
+            if score > best_score:
+                best_score, best = score, (full, location)
+        if best is None:
+            return None
+
+        # 精确匹配: 在粗匹配位置附近的原尺寸画面中定位
+        full, (cx, cy) = best
+        margin = 4
+        x0 = max(0, cx * 2 - margin)
+        y0 = max(0, cy * 2 - margin)
+        window = region[y0:y0 + full.shape[0] + margin * 2, x0:x0 + full.shape[1] + margin * 2]
+        if window.shape[0] < full.shape[0] or window.shape[1] < full.shape[1]:
+            return None
+        _, score, _, location = cv2.minMaxLoc(cv2.matchTemplate(window, full, cv2.TM_CCOEFF_NORMED))
+        if score < self.threshold:
+            self.logger.debug(f"元素 {self._name(element)} 匹配度不足 ({score:.2f})，使用记录的坐标")
+            return None
+        return (left + x0 + location[0] + full.shape[1] // 2,
+                top + y0 + location[1] + full.shape[0] // 2)
+
+    def locate(self, frame, element, state=None, size=None):
+        """返回元素在frame中的坐标(x, y)
+
+        state: 当前画面状态，同一状态下元素的位置不变，匹配结果会被缓存；为None时每次都重新匹配
+        frame为None时不做匹配，按size=(宽, 高)换算记录的坐标
+        """
+        if frame is None:
+            return self.scale_point(element['x'], element['y'], size)
+        size = (frame.width, frame.height)
+        key = (state, self._name(element), size[0], size[1])
+        if state is not None and key in self._positions:
+            return self._positions[key]
+        position = self._match(frame, element, size)
+        if position is None:
+            return self.scale_point(element['x'], element['y'], size)
+        if state is not None:
+            self._positions[key] = position
+        return position
+
+    def forget(self, state=None):
+        """清除缓存的位置，state为None时清除全部"""
+        if state is None:
+            self._positions.clear()
+        else:
+            self._positions = {key: value for key, value in self._positions.items() if key[0] != state}
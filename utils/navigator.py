@@ -0,0 +1,175 @@
+import asyncio
+import re
+import time
+import numpy as np
+from .config import Config
+from .log import Logger
+from .screenshot import ScreenshotManager
+
+# dumpsys window中的焦点窗口，例如 mCurrentFocus=Window{1a2b3c u0 com.ets100.secondary/.ui.main.MainActivity}
+FOCUS_PATTERN = re.compile(r'mCurrentFocus=Window\{\S+ \S+ ([^\s}]+)\}')
+
+
+class Navigator:
+    """以前台界面和画面稳定为准等待页面跳转完成，代替固定时长的等待
+
+    每次跳转之后:
+        1. (可选) 轮询焦点窗口，确认前台已经是目标应用/Activity
+        2. 画面先发生变化(或超过change_grace秒)，再连续settle_frames帧与前一帧几乎相同并保持settle_time秒，
+           或者直接等待目标页面的画面条件(condition)成立，即认为页面已就绪
+    条件满足后立即返回；快的设备不用白等，慢的设备也不会在页面加载完之前继续操作。
+    """
+
+    def __init__(self, adb_controller, async_adb, screenshot_mgr=None):
+        self.logger = Logger().get_logger()
+        config = Config()
+        self.async_adb = async_adb
+        self.screenshot_mgr = screenshot_mgr or ScreenshotManager(adb_controller)
+        self.timeout = config.get("navigation", "timeout")
+        self.settle_frames = config.get("navigation", "settle_frames")
+        self.settle_threshold = config.get("navigation", "settle_threshold")
+        self.settle_time = config.get("navigation", "settle_time")
+        self.change_grace = config.get("navigation", "change_grace")
+        self.poll_interval = config.get("navigation", "poll_interval")
+
+    async def foreground(self):
+        """返回焦点窗口的组件名(包名/Activity)，获取失败时返回None"""
+        output = await self.async_adb.shell('dumpsys window | grep mCurrentFocus')
+        match = FOCUS_PATTERN.search(output or '')
+        return match.group(1) if match else None
+
+    async def wait_for_foreground(self, activity, timeout=None):
+        """等待前台窗口满足条件，返回组件名，超时抛出asyncio.TimeoutError
+        activity: 组件名中需要包含的字符串，或 组件名 -> bool 的函数
+        """
+        matches = activity if callable(activity) else (lambda component: activity in component)
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            component = await self.foreground()
+            if component is not None and matches(component):
+                return component
+            if time.monotonic() >= deadline:
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(self.poll_interval)
+
+    async def wait_for_stopped(self, package, timeout=None):
+        """等待应用进程退出，超时抛出asyncio.TimeoutError"""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while True:
+            output = await self.async_adb.shell(f'pidof {package}')
+            # 命令失败时(None)无法判断，不再等待
+            if output is None or not output.strip():
+                return
+            if time.monotonic() >= deadline:
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(self.poll_interval)
+
+    @staticmethod
+    def _thumbnail(frame):
+        """每8个像素取一个，足以判断画面是否在变化"""
+        return frame.bgr[::8, ::8].astype(np.int16)
+
+    def _changed(self, thumbnail, other):
+        return thumbnail.shape != other.shape or np.abs(thumbnail - other).mean() > self.settle_threshold
+
+    async def _wait_changed(self, seq, deadline, reference=None):
+        """等待画面开始变化，返回第一帧变化后的帧；超过change_grace秒仍没有变化时返回当时的帧
+        reference: 跳转前的帧，为None时以之后的第一帧为准
+        """
+        mgr = self.screenshot_mgr
+        grace = time.monotonic() + self.change_grace
+        base = self._thumbnail(reference) if reference is not None else None
+        frame = reference
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                raise asyncio.TimeoutError()
+            if now > grace and frame is not None:
+                return frame
+            # 后台截图期间画面静止时可能没有新帧，最多等到change_grace结束
+            wait = min(deadline, max(grace, now + self.poll_interval)) - now if mgr.running else deadline - now
+            try:
+                frame = await mgr.next_frame(seq, timeout=wait)
+            except asyncio.TimeoutError:
+                if not mgr.running:
+                    raise
+                continue
+            seq = frame.seq
+            thumbnail = self._thumbnail(frame)
+            if base is None:
+                base = thumbnail
+            elif self._changed(thumbnail, base):
+                return frame
+
+    async def wait_settled(self, timeout=None, after_seq=None, reference=None):
+        """等待画面稳定，返回稳定后的最后一帧，超时抛出asyncio.TimeoutError
+        after_seq: 只检查序号大于该值的帧
+        reference: 跳转前的帧；画面要先与它不同才开始计算，避免把跳转前的静止画面当作结果
+        画面变化后，连续settle_frames帧与前一帧几乎相同、并且已有settle_time秒没有变化才算稳定，
+        只停留一两帧的加载占位画面不会被当作目标页面。
+        """
+        mgr = self.screenshot_mgr
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        seq = mgr.seq if after_seq is None else after_seq
+        frame = await self._wait_changed(seq, deadline, reference)
+        previous = self._thumbnail(frame)
+        stable = 0
+        since = time.monotonic()  # 最近一次画面变化的时间
+        while True:
+            now = time.monotonic()
+            if stable >= self.settle_frames and now - since >= self.settle_time:
+                return frame
+            remaining = deadline - now
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            # 后台截图期间画面静止时实时视频流不会产生新帧: 等到settle_time仍没有新帧即认为已稳定
+            quiet = mgr.running
+            wait = min(remaining, max(self.poll_interval, since + self.settle_time - now)) if quiet else remaining
+            try:
+                latest = await mgr.next_frame(frame.seq, timeout=wait)
+            except asyncio.TimeoutError:
+                if not quiet or time.monotonic() >= deadline:
+                    raise
+                stable = max(stable, self.settle_frames)
+                continue
+            thumbnail = self._thumbnail(latest)
+            # 连续与前一帧相同的帧数，画面变化时清零
+            if self._changed(thumbnail, previous):
+                stable = 0
+                since = time.monotonic()
+            else:
+                stable += 1
+            previous = thumbnail
+            frame = latest
+
+    async def navigate(self, action=None, activity=None, timeout=None, condition=None, stable_frames=1):
+        """执行跳转动作并等待目标页面就绪，返回就绪时的帧
+        action: 触发跳转的协程函数(例如点击)，为None时只等待画面稳定
+        activity: 跳转后前台组件需满足的条件(见wait_for_foreground)，不满足时抛出asyncio.TimeoutError
+        condition: 目标页面的画面条件(例如画面状态表中的状态)；指定时画面变化后等它连续stable_frames帧成立，
+            超时抛出asyncio.TimeoutError，比只等画面稳定更可靠
+        未指定condition、画面在超时前仍未稳定时只记录警告并返回最后一帧(例如页面上有轮播图)
+        跳转前的画面取自最近一帧(last_frame)，不额外截图
+        """
+        mgr = self.screenshot_mgr
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        reference = mgr.last_frame
+        seq = mgr.seq
+        if action is not None:
+            await action()
+        if activity is not None:
+            component = await self.wait_for_foreground(activity, timeout)
+            self.logger.debug(f"前台界面: {component}")
+        if condition is not None:
+            changed = await self._wait_changed(seq, deadline, reference)
+            frame = await mgr.wait_until(condition, deadline - time.monotonic(), stable_frames, changed.seq - 1)
+        else:
+            try:
+                frame = await self.wait_settled(deadline - time.monotonic(), seq, reference)
+            except (asyncio.TimeoutError, RuntimeError):
+                self.logger.warning(f"画面在 {timeout} 秒内未稳定，继续执行")
+                return mgr.last_frame
+        self.logger.info(f"页面已就绪，用时 {time.monotonic() - start:.2f} 秒")
+        return frame
@@ -1,7 +1,165 @@
 import pytesseract
 import cv2
+import os
+import queue
+import threading
+from abc import ABC, abstractmethod
 from .log import Logger
 from .config import Config
+from .ocr_cache import OCRCache
+
+try:
+    import tesserocr
+except ImportError:  # 可选依赖，未安装时只能使用tesseract命令行
+    tesserocr = None
+
+
+class OCREngine(ABC):
+    """OCR引擎的基类，recognize接收预处理后的单通道二值图"""
+    name = "未命名引擎"
+
+    def __init__(self, language='eng', oem=3, psm=3):
+        self.logger = Logger().get_logger()
+        self.language = language
+        self.oem = oem
+        self.psm = psm
+
+    def open(self):
+        """加载引擎，成功返回True"""
+        return True
+
+    @abstractmethod
+    def recognize(self, binary) -> str:
+        """识别二值图中的文字"""
+        pass
+
+    def close(self):
+        """释放引擎"""
+        pass
+
+
+class TesseractProcessEngine(OCREngine):
+    """每次识别都启动一次tesseract命令行(pytesseract)，需要写临时文件并重新加载模型"""
+    name = "pytesseract"
+
+    def __init__(self, tesseract_cmd, **kwargs):
+        super().__init__(**kwargs)
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    def recognize(self, binary):
+        custom_config = f'--oem {self.oem} --psm {self.psm} -l {self.language}'
+        return pytesseract.image_to_string(binary, config=custom_config)
+
+
+class TesseractAPIEngine(OCREngine):
+    """进程内常驻的Tesseract(tesserocr)，模型只在open时加载一次
+
+    识别时tesserocr会释放GIL，多个引擎可以在不同线程中并行识别。
+    """
+    name = "tesserocr"
+
+    def __init__(self, tessdata=None, **kwargs):
+        super().__init__(**kwargs)
+        self.tessdata = tessdata
+        self._api = None
+
+    def open(self):
+        if tesserocr is None:
+            self.logger.warning("未安装tesserocr，无法使用常驻OCR引擎")
+            return False
+        try:
+            if self.tessdata:
+                self._api = tesserocr.PyTessBaseAPI(path=self.tessdata, lang=self.language, psm=self.psm, oem=self.oem)
+            else:
+                self._api = tesserocr.PyTessBaseAPI(lang=self.language, psm=self.psm, oem=self.oem)
+            return True
+        except Exception as e:
+            self.logger.warning(f"加载tesserocr引擎失败: {str(e)}")
+            return False
+
+    def recognize(self, binary):
+        height, width = binary.shape[:2]
+        self._api.SetImageBytes(binary.tobytes(), width, height, 1, width)
+        try:
+            return self._api.GetUTF8Text()
+        finally:
+            self._api.Clear()
+
+    def close(self):
+        if self._api is not None:
+            self._api.End()
+            self._api = None
+
+
+class OCREnginePool:
+    """OCR引擎池: 按需创建最多size个引擎，每次识别借用一个空闲引擎，供多个线程并行识别"""
+
+    def __init__(self, factory, size=1):
+        self.factory = factory
+        self.size = max(1, size)
+        self._idle = queue.Queue()
+        self._engines = []
+        self._lock = threading.Lock()
+
+    def open(self):
+        """预先创建一个引擎，确认引擎可用并提前加载模型"""
+        engine = self._create()
+        if engine is None:
+            return False
+        self._idle.put(engine)
+        return True
+
+    def _create(self):
+        engine = self.factory()
+        if not engine.open():
+            return None
+        self._engines.append(engine)
+        return engine
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._engines) < self.size:
+                engine = self._create()
+                if engine is not None:
+                    return engine
+        return self._idle.get()
+
+    def recognize(self, binary):
+        engine = self._acquire()
+        try:
+            return engine.recognize(binary)
+        finally:
+            self._idle.put(engine)
+
+    def close(self):
+        for engine in self._engines:
+            engine.close()
+        self._engines = []
+        self._idle = queue.Queue()
+
+
+def create_ocr_engine(name, config=None):
+    """根据名称创建OCR引擎
+    name: tesserocr / pytesseract
+    config: ocr配置段
+    """
+    config = config or {}
+    options = {'language': config.get('language', 'eng')}
+    tesseract_cmd = config.get('tesseract_cmd', 'tesseract')
+    if name == 'tesserocr':
+        tessdata = config.get('tessdata') or None
+        if tessdata is None:
+            # Windows安装包的模型位于tesseract.exe同目录的tessdata下
+            default_tessdata = os.path.join(os.path.dirname(tesseract_cmd), 'tessdata')
+            if os.path.isdir(default_tessdata):
+                tessdata = default_tessdata
+        return TesseractAPIEngine(tessdata=tessdata, **options)
+    return TesseractProcessEngine(tesseract_cmd, **options)
+
 
 class OCRProcessor:
     _instance = None
@@ -15,9 +173,33 @@ class OCRProcessor:
     def _initialize(self):
         self.logger = Logger().get_logger()
         self.config = Config()
-        # 配置Tesseract
-        pytesseract.pytesseract.tesseract_cmd = self.config.get("ocr", "tesseract_cmd")
+        ocr_config = self.config.get("ocr")
+        # 命令行引擎始终可用，作为常驻引擎的后备
+        self.fallback = create_ocr_engine('pytesseract', ocr_config)
+        self.persistent = False  # 引擎池是否为常驻引擎
+        self.pool = self._open_pool(ocr_config)
+        # 识别结果缓存，相同的句子图片不再重复识别
+        self.cache = None
+        if self.config.get("ocr", "cache"):
+            self.cache = OCRCache(
+                os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'ocr'),
+                memory_size=self.config.get("ocr", "cache_size"),
+                disk_size=self.config.get("ocr", "cache_disk_size") * 1024 * 1024,
+                tolerance=self.config.get("ocr", "cache_tolerance"))
         
+    def _open_pool(self, ocr_config):
+        """按配置创建引擎池，auto时优先使用常驻引擎，不可用时回退到命令行"""
+        name = self.config.get("ocr", "engine")
+        size = self.config.get("ocr", "pool_size")
+        if name in ('auto', 'tesserocr'):
+            pool = OCREnginePool(lambda: create_ocr_engine('tesserocr', ocr_config), size)
+            if pool.open():
+                self.persistent = True
+                self.logger.info(f"使用常驻OCR引擎 tesserocr (最多 {pool.size} 个)")
+                return pool
+            self.logger.warning("常驻OCR引擎不可用，使用tesseract命令行")
+        return OCREnginePool(lambda: create_ocr_engine('pytesseract', ocr_config), size)
+
     def preprocess_image(self, image):
         """预处理图片以提高OCR准确性"""
         # 转换为灰度图
@@ -26,6 +208,16 @@ class OCRProcessor:
         _, binary = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY_INV)
         return binary
 
+    def _recognize(self, binary):
+        """使用引擎池识别，常驻引擎出错时改用命令行"""
+        try:
+            return self.pool.recognize(binary)
+        except Exception as e:
+            if not self.persistent:
+                raise
+            self.logger.warning(f"常驻OCR引擎识别失败，改用tesseract命令行: {str(e)}")
+            return self.fallback.recognize(binary)
+
     def recognize_text(self, image) -> str:
         """识别图片中的文字"""
         try:
@@ -35,11 +227,16 @@ class OCRProcessor:
             # 设置OCR选项
             custom_config = r'--oem 3 --psm 3 -l ' + self.config.get("ocr", "language")
             
-            # 执行OCR
-            text = pytesseract.image_to_string(processed_img, config=custom_config)
-            
-            # 清理文本
-            text = text.strip()
+            # 优先使用缓存的识别结果
+            text = self.cache.get(processed_img, custom_config) if self.cache else None
+            if text is None:
+                # 执行OCR
+                text = self._recognize(processed_img)
+                
+                # 清理文本
+                text = text.strip()
+                if text and self.cache:
+                    self.cache.put(processed_img, text, custom_config)
             if text:
                 self.logger.info(f"OCR识别结果: {text}")
                 return text
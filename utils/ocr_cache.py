@@ -0,0 +1,131 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from .disk_cache import DiskLRU
+from .log import Logger
+
+
+class OCRCache:
+    """OCR识别结果缓存
+
+    以二值化后的裁剪图片为键: 内存中保留最近使用的结果(LRU)，磁盘上保存全部结果并按总大小淘汰最久未用的(DiskLRU)。
+    同一句话的截图偶尔会因为抗锯齿出现零星的像素差异，哈希未命中时还会在尺寸相同的缓存中查找近似图片:
+    差异像素占比不超过tolerance，且都是孤立的点或细线(2x2腐蚀后消失)，换了字母则不会命中。
+    """
+
+    def __init__(self, cache_dir, memory_size=256, disk_size=32 * 1024 * 1024, tolerance=0.01):
+        self.logger = Logger().get_logger()
+        self.cache_dir = cache_dir
+        self.memory_size = memory_size
+        self.tolerance = tolerance
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # 键 -> 缓存项
+        self._lock = threading.Lock()
+        # 磁盘缓存的索引: 键 -> 缓存项(不含图片)；从目录中收回的项没有识别结果，只参与淘汰
+        self.lru = DiskLRU(cache_dir, disk_size, suffix='.npy', name="OCR缓存") if disk_size else None
+        self._index = self.lru.entries if self.lru else {}
+
+    @staticmethod
+    def _key(binary, namespace):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{namespace}|{binary.shape[0]}x{binary.shape[1]}|".encode())
+        digest.update(np.ascontiguousarray(binary).data)
+        return digest.hexdigest()
+
+    def _load_bits(self, key):
+        try:
+            return np.load(self.lru.path(key))
+        except Exception:
+            return None
+
+    def _similar(self, binary, bits):
+        """判断二值图与缓存的打包图片是否只有抗锯齿噪声级别的差异"""
+        other = np.unpackbits(bits, count=binary.size).reshape(binary.shape)
+        diff = (binary > 0).view(np.uint8) ^ other
+        if np.count_nonzero(diff) > self.tolerance * binary.size:
+            return False
+        return not cv2.erode(diff, np.ones((2, 2), np.uint8)).any()
+
+    def _find_similar(self, binary, namespace, ink):
+        """在内存和磁盘缓存中查找近似的图片，返回(键, 缓存项)"""
+        limit = self.tolerance * binary.size
+        shape = list(binary.shape)
+
+        def candidates(entries):
+            for key, entry in entries:
+                if 'text' not in entry:
+                    continue
+                if entry['namespace'] == namespace and entry['shape'] == shape and abs(entry['ink'] - ink) <= limit:
+                    yield key, entry
+
+        for key, entry in candidates(list(self._memory.items())):
+            if entry['bits'] is not None and self._similar(binary, entry['bits']):
+                return key, entry
+        for key, entry in candidates(list(self._index.items())):
+            if key in self._memory:
+                continue
+            bits = self._load_bits(key)
+            if bits is not None and self._similar(binary, bits):
+                return key, dict(entry, bits=bits)
+        return None, None
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _log(self, result):
+        self.logger.info(f"OCR缓存{result}: 命中 {self.hits} 次，未命中 {self.misses} 次")
+
+    def get(self, binary, namespace=''):
+        """查找二值图的识别结果，未命中时返回None"""
+        key = self._key(binary, namespace)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                tier = '命中(内存)'
+            elif 'text' in self._index.get(key, {}):
+                entry = dict(self._index[key], bits=self._load_bits(key))
+                self._remember(key, entry)
+                tier = '命中(磁盘)'
+            else:
+                ink = int(np.count_nonzero(binary))
+                similar_key, entry = self._find_similar(binary, namespace, ink)
+                if entry is None:
+                    self.misses += 1
+                    self._log('未命中')
+                    return None
+                key = similar_key
+                self._remember(key, entry)
+                tier = '命中(近似)'
+            if self.lru is not None:
+                self.lru.touch(key)
+            self.hits += 1
+            self._log(tier)
+            return entry['text']
+
+    def put(self, binary, text, namespace=''):
+        """保存二值图的识别结果"""
+        key = self._key(binary, namespace)
+        bits = np.packbits(binary > 0)
+        entry = {
+            'namespace': namespace,
+            'shape': list(binary.shape),
+            'ink': int(np.count_nonzero(binary)),
+            'text': text,
+        }
+        with self._lock:
+            self._remember(key, dict(entry, bits=bits))
+            if self.lru is None:
+                return
+            try:
+                self.lru.write(self.lru.path(key), lambda f: np.save(f, bits))
+            except Exception as e:
+                self.logger.error(f"保存OCR缓存失败: {str(e)}")
+                return
+            self.lru.add(key, dict(entry, size=bits.nbytes + len(text.encode())))
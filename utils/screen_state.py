@@ -0,0 +1,41 @@
+from .condition import ConditionSet, PixelCondition
+
+
+class ScreenStateClassifier:
+    """根据声明式的状态表判断画面所处的状态
+
+    states: {状态名: [(x, y, color, tolerance), ...]}，状态的先后顺序即优先级。
+    所有状态的采样点编译为一个ConditionSet，每帧只需一次取色和比较就能得到全部状态；
+    同一帧的结果会被缓存，多处查询不会重复计算。
+    """
+
+    def __init__(self, states):
+        self.names = list(states)
+        self._conditions = ConditionSet(
+            [PixelCondition(probes, name=name) for name, probes in states.items()])
+        self._last_frame = None
+        self._last_result = None
+
+    def evaluate(self, frame):
+        """返回每个状态是否成立的布尔数组(与names顺序一致)"""
+        if frame is not self._last_frame:
+            self._last_result = self._conditions.evaluate(frame)
+            self._last_frame = frame
+        return self._last_result
+
+    def match(self, frame):
+        """返回画面满足的所有状态"""
+        result = self.evaluate(frame)
+        return {name for name, matched in zip(self.names, result) if matched}
+
+    def classify(self, frame):
+        """返回画面满足的优先级最高的状态，都不满足时返回None"""
+        for name, matched in zip(self.names, self.evaluate(frame)):
+            if matched:
+                return name
+        return None
+
+    def condition(self, *names):
+        """生成可用于ScreenshotManager.wait_until的条件: 画面处于任一指定状态"""
+        indices = [self.names.index(name) for name in names]
+        return lambda frame: bool(self.evaluate(frame)[indices].any())
@@ -1,56 +1,263 @@
+import asyncio
+import threading
 import time
-from PIL import Image
-import io
+from collections import deque
 import numpy as np
-import cv2
 from .adb import ADBController
+from .condition import ConditionSet
+from .frame_source import Frame, RAW_PIXEL_FORMATS, ScreencapSource, create_frame_source
 from .log import Logger
 from .config import Config
 
+# 取色时在设备端保存原始截图的临时文件(文件名不能以.png结尾，否则会被编码)
+PROBE_PATH = '/data/local/tmp/hwllo_probe.raw'
+
+
+def _resolve_waiter(future, frame):
+    if not future.done():
+        future.set_result(frame)
+
+
 class ScreenshotManager:
-    def __init__(self, adb_controller: ADBController):
+    def __init__(self, adb_controller: ADBController, buffer_size=8, source=None):
         self.config = Config()
         self.adb = adb_controller
         self.fps = self.config.get("screenshot", "fps")
         self.running = False
         self.logger = Logger().get_logger()
-        self.last_screenshot = None
+        self.last_frame = None
         self.last_screenshot_time = 0
+        self._probe_layout = None  # (宽度, 头部大小, 通道顺序)
 
-    def get_screenshot(self, force_new=False, max_age_ms=200):
-        """获取截图
+        # 截图来源: 单次截图总是可以使用screencap，后台截图线程使用配置的来源
+        self._screencap = ScreencapSource(adb_controller, self.config.get("screenshot", "mode"))
+        if source is None:
+            source = create_frame_source(
+                adb_controller, self.config.get("screenshot", "source"), self.config.get("screenshot"))
+        self.source = source
+        self._source_opened = False
+
+        # 环形缓冲区: 保存最近的若干帧，由后台截图线程写入
+        self._frames = deque(maxlen=buffer_size)
+        self._frames_lock = threading.Lock()
+        self._seq = 0
+        self._waiters = []  # [(事件循环, future, after_seq), ...]
+        self._capture_thread = None
+
+    @property
+    def seq(self):
+        """最新一帧的序号"""
+        return self._seq
+
+    @property
+    def last_screenshot(self):
+        return self.last_frame.bgr if self.last_frame is not None else None
+
+    def _open_source(self):
+        """按需打开截图来源，失败时退回screencap"""
+        if not self._source_opened:
+            self._source_opened = self.source.open()
+            if not self._source_opened:
+                self.logger.warning(f"截图来源 {self.source.name} 打开失败，改用screencap")
+                self.source = self._screencap
+                self._source_opened = True
+        return self.source
+
+    def capture_frame(self):
+        """获取一帧新的截图，失败时返回None"""
+        # 视频流类的来源只供后台截图线程使用，单次截图直接调用screencap
+        source = self._screencap if self.source.realtime else self._open_source()
+        return source.read()
+
+    def get_frame(self, force_new=False, max_age_ms=200):
+        """获取截图帧(Frame)
         force_new: 是否强制获取新截图
         max_age_ms: 上一次截图的最大有效期(毫秒)
         """
         current_time = time.time() * 1000
-        
-        if not force_new and self.last_screenshot is not None:
+
+        if not force_new and self.last_frame is not None:
             if current_time - self.last_screenshot_time < max_age_ms:
-                return self.last_screenshot
+                return self.last_frame
+
+        frame = self.capture_frame()
+        if frame is not None:
+            self._publish(frame)
+        return frame
 
-        screenshot_bytes = self.adb.screencap()
-        if screenshot_bytes:
+    def get_screenshot(self, force_new=False, max_age_ms=200):
+        """获取BGR格式的截图
+        force_new: 是否强制获取新截图
+        max_age_ms: 上一次截图的最大有效期(毫秒)
+        """
+        frame = self.get_frame(force_new=force_new, max_age_ms=max_age_ms)
+        return frame.bgr if frame is not None else None
+
+    def _get_probe_layout(self):
+        """读取设备端原始截图的宽度、头部大小和像素格式"""
+        if self._probe_layout is None:
+            output = self.adb.shell(
+                f'screencap {PROBE_PATH} && wc -c < {PROBE_PATH} && head -c 12 {PROBE_PATH} | od -An -tu4')
+            if not output:
+                return None
             try:
-                # 转换为PIL图像
-                image = Image.open(io.BytesIO(screenshot_bytes))
-                # 转换为OpenCV格式
-                cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-                
-                self.last_screenshot = cv_image
-                self.last_screenshot_time = current_time
-                return cv_image
-            except Exception as e:
-                self.logger.error(f"截图处理失败: {str(e)}")
+                size, width, height, pixel_format = (int(v) for v in output.split()[:4])
+            except ValueError:
+                self.logger.warning(f"无法解析设备截图格式: {output.strip()}")
                 return None
-        return None
+            order = RAW_PIXEL_FORMATS.get(pixel_format)
+            header_size = size - width * height * 4
+            if order is None or header_size not in (12, 16):
+                self.logger.warning(f"设备截图格式不支持取色: format={pixel_format}, size={size}")
+                return None
+            self._probe_layout = (width, header_size, order)
+        return self._probe_layout
+
+    def probe(self, points):
+        """只读取若干个像素点的颜色，避免传输整帧截图
+        points: [(x, y), ...]
+        返回 (n, 3) 的BGR颜色数组，失败时返回None
+        """
+        layout = self._get_probe_layout() if self._screencap.mode == 'raw' else None
+        if layout is None:
+            # 不支持设备端取色时，从完整截图中读取
+            screen = self.get_screenshot(force_new=True)
+            if screen is None:
+                return None
+            return np.array([screen[y, x] for x, y in points], dtype=np.uint8)
+
+        width, header_size, order = layout
+        # 头部大小和每个像素都是4字节，可以直接以4字节为块跳转
+        reads = ' && '.join(
+            f'dd if={PROBE_PATH} bs=4 skip={header_size // 4 + y * width + x} count=1 2>/dev/null'
+            for x, y in points)
+        data = self.adb.exec_out(f'screencap {PROBE_PATH} && {reads}')
+        if not data or len(data) != 4 * len(points):
+            self.logger.warning("设备端取色失败")
+            return None
+        frame = Frame(np.frombuffer(data, dtype=np.uint8).reshape(1, len(points), 4), order)
+        return frame.bgr[0]
+
+    def _publish(self, frame):
+        """为新帧分配序号，写入环形缓冲区并唤醒等待的协程"""
+        with self._frames_lock:
+            self._seq += 1
+            frame.seq = self._seq
+            self._frames.append(frame)
+            self.last_frame = frame
+            self.last_screenshot_time = frame.timestamp * 1000
+
+            ready = [w for w in self._waiters if w[2] < frame.seq]
+            self._waiters = [w for w in self._waiters if w[2] >= frame.seq]
+
+        for loop, future, _ in ready:
+            loop.call_soon_threadsafe(_resolve_waiter, future, frame)
+
+    def get_frames(self, after_seq=0):
+        """返回环形缓冲区中序号大于after_seq的所有帧(按时间顺序)"""
+        with self._frames_lock:
+            return [frame for frame in self._frames if frame.seq > after_seq]
+
+    async def next_frame(self, after_seq=0, timeout=None):
+        """等待并返回序号大于after_seq的最新一帧
+        after_seq: 调用者已处理过的最后一帧的序号
+        timeout: 超时时间(秒)，超时抛出asyncio.TimeoutError
+        """
+        loop = asyncio.get_running_loop()
+        future = None
+        with self._frames_lock:
+            if self._frames and self._frames[-1].seq > after_seq:
+                return self._frames[-1]
+            if self.running:
+                future = loop.create_future()
+                self._waiters.append((loop, future, after_seq))
+
+        if future is None:
+            # 没有后台截图线程时，在线程池中截图，避免阻塞事件循环
+            frame = await asyncio.wait_for(asyncio.to_thread(self.get_frame, True), timeout)
+            if frame is None:
+                raise RuntimeError("截图失败")
+            return frame
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            with self._frames_lock:
+                self._waiters = [w for w in self._waiters if w[1] is not future]
+
+    async def wait_for_any(self, conditions, timeout=None, stable_frames=1, after_seq=None):
+        """等待任意一个条件在连续stable_frames帧中成立
+        conditions: 条件列表(PixelCondition / RegionCondition / frame -> bool)或已编译的ConditionSet
+        timeout: 超时时间(秒)，超时抛出asyncio.TimeoutError
+        after_seq: 只检查序号大于该值的帧，默认只检查调用之后的新帧
+        返回 (成立的条件序号, 帧)
+        """
+        condition_set = conditions if isinstance(conditions, ConditionSet) else ConditionSet(conditions)
+        counts = np.zeros(len(condition_set.conditions), dtype=int)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        seq = self._seq if after_seq is None else after_seq
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+            frame = await self.next_frame(seq, timeout=remaining)
+            seq = frame.seq
+            # 连续成立的帧数，不成立时清零
+            counts = np.where(condition_set.evaluate(frame), counts + 1, 0)
+            hits = np.flatnonzero(counts >= stable_frames)
+            if hits.size:
+                return int(hits[0]), frame
+
+    async def wait_until(self, condition, timeout=None, stable_frames=1, after_seq=None):
+        """等待条件在连续stable_frames帧中成立，返回满足条件的帧
+        condition: 单个条件，或需要同时成立的条件列表
+        """
+        if isinstance(condition, (list, tuple)):
+            condition_set = ConditionSet(condition)
+            condition = lambda frame: condition_set.evaluate(frame).all()
+        _, frame = await self.wait_for_any([condition], timeout, stable_frames, after_seq)
+        return frame
 
     def start_capture(self):
-        """开始连续截图"""
+        """在后台线程中按配置的fps连续截图"""
+        if self._capture_thread is not None and self._capture_thread.is_alive():
+            return
         self.running = True
+        self._capture_thread = threading.Thread(
+            target=self._capture_loop, name='ScreenshotCapture', daemon=True)
+        self._capture_thread.start()
+
+    def _capture_loop(self):
+        interval = 1 / self.fps
+        source = self._open_source()
+        self.logger.debug(f"后台截图已启动，来源: {source.name}")
         while self.running:
-            self.get_screenshot(force_new=True)
-            time.sleep(1/self.fps)
+            start = time.perf_counter()
+            # 实时来源会在有新帧时立即返回，画面静止时最多等待一个间隔
+            frame = source.read(timeout=interval)
+            if frame is not None:
+                self._publish(frame)
+            if source.realtime:
+                continue
+            delay = interval - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
 
     def stop_capture(self):
         """停止连续截图"""
         self.running = False
+        thread = self._capture_thread
+        self._capture_thread = None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        if self.source.realtime and self._source_opened:
+            self.source.close()
+            self._source_opened = False
+
+        # 取消仍在等待新帧的协程
+        with self._frames_lock:
+            waiters, self._waiters = self._waiters, []
+        for loop, future, _ in waiters:
+            loop.call_soon_threadsafe(future.cancel)
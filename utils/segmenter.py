@@ -0,0 +1,184 @@
+import numpy as np
+from .log import Logger
+
+
+def _color_codes(image):
+    """把BGR像素打包为24位整数(0xRRGGBB)，便于一次比较整组颜色"""
+    image = image.astype(np.uint32)
+    return (image[..., 2] << 16) | (image[..., 1] << 8) | image[..., 0]
+
+
+class SentenceSegmenter:
+    """跟读文本的句子区域分割器
+
+    在range范围内以step_height为单位扩展选择框，找到第一块满足以下条件的区域:
+    不含异常颜色(已读/正在读的句子等)、含有文字、且下方两个单位全为白色(句子结束)。
+    范围内每个像素只分类一次，得到逐行的"异常颜色"和"全白"剖面后，
+    在一维剖面上完成查找，结果与逐步切片检查的做法一致。
+
+    句子总是自上而下依次朗读，track()会记住上一次找到的句子(位置和内容指纹)，
+    页面没有变化时从该句子处向下查找，只需分类大约一句话高度的像素；
+    页面滚动或内容变化时回退为完整查找。
+    """
+
+    def __init__(self, rect, step_height, unexpected_colors, background=(255, 255, 255)):
+        self.top = rect['top']
+        self.bottom = rect['bottom']
+        self.left = rect['left']
+        self.right = rect['right']
+        self.step = step_height
+        self.unexpected_codes = _color_codes(np.array(unexpected_colors, dtype=np.uint8).reshape(-1, 1, 3)).ravel()
+        self.background = np.array(background, dtype=np.uint8)
+        # 选择框最多扩展到的单位数
+        self.chunks = (self.bottom - self.top) // self.step + 1
+        # 每次计算剖面的块数，找到句子后不再计算后面的部分
+        self.window = 8
+        self.logger = Logger().get_logger()
+        self._last = None  # 上一次找到的句子 (y1, y2, 内容指纹)
+        self.scroll_offset = 0  # 最近一次检测到的页面滚动距离(像素，向上滚动为负)
+
+    def row_profiles(self, image, top=None, bottom=None):
+        """返回[top, bottom)中每一行是否含有异常颜色、是否全为背景色"""
+        top = self.top if top is None else top
+        bottom = min(self.top + self.chunks * self.step if bottom is None else bottom, image.shape[0])
+        codes = _color_codes(image[top:bottom, self.left:self.right])
+        unexpected = np.isin(codes, self.unexpected_codes).any(axis=1)
+        return unexpected, self.blank_rows(image, top, bottom)
+
+    def blank_rows(self, image, top=None, bottom=None):
+        """返回[top, bottom)中每一行是否全为背景色，不检查异常颜色，比row_profiles更快"""
+        top = self.top if top is None else top
+        bottom = self.top + self.chunks * self.step if bottom is None else bottom
+        region = image[top:bottom, self.left:self.right]
+        # 每行的像素在内存中连续，按字节与整行背景色比较
+        rows = region.reshape(region.shape[0], -1)
+        return (rows == np.tile(self.background, region.shape[1])).all(axis=1)
+
+    def chunk_profiles(self, image, start_chunk=0, end_chunk=None):
+        """按step_height分块汇总行剖面，范围为[start_chunk, end_chunk)"""
+        end_chunk = self.chunks if end_chunk is None else end_chunk
+        top = self.top + start_chunk * self.step
+        rows = (end_chunk - start_chunk) * self.step
+        unexpected, blank = self.row_profiles(image, top, top + rows)
+        # 超出图片的行视为不含任何像素(不含异常颜色、全白)
+        missing = rows - len(unexpected)
+        if missing > 0:
+            unexpected = np.concatenate([unexpected, np.zeros(missing, dtype=bool)])
+            blank = np.concatenate([blank, np.ones(missing, dtype=bool)])
+        shape = (end_chunk - start_chunk, self.step)
+        return unexpected.reshape(shape).any(axis=1), blank.reshape(shape).all(axis=1)
+
+    def _scan(self, chunk_unexpected, chunk_blank, head=0, first=0):
+        """在分块剖面上从first块之后继续查找句子
+
+        返回(起始块, 结束块)，找不到时返回(当前起始块, None)，以便补充剖面后继续查找
+        """
+        for tail in range(first + 1, len(chunk_unexpected) + 1):
+            if chunk_unexpected[tail - 1]:
+                head = tail
+                continue
+            if tail - head >= 2:
+                if not chunk_blank[head:tail].all():
+                    # 区域内有文字，且最下方两块全白，说明句子已经结束
+                    if chunk_blank[tail - 2] and chunk_blank[tail - 1]:
+                        return head, tail
+                else:
+                    head = tail
+        return head, None
+
+    def _search(self, image, start_chunk=0):
+        """从start_chunk开始逐个窗口计算剖面并查找句子，返回(y1, y2)，找不到时返回None"""
+        unexpected = np.zeros(0, dtype=bool)
+        blank = np.zeros(0, dtype=bool)
+        head = 0
+        chunk = start_chunk
+        while chunk < self.chunks:
+            end = min(chunk + self.window, self.chunks)
+            window_unexpected, window_blank = self.chunk_profiles(image, chunk, end)
+            first = len(unexpected)
+            unexpected = np.concatenate([unexpected, window_unexpected])
+            blank = np.concatenate([blank, window_blank])
+            head, tail = self._scan(unexpected, blank, head, first)
+            if tail is not None:
+                return self.top + (start_chunk + head) * self.step, self.top + (start_chunk + tail) * self.step
+            chunk = end
+        return None
+
+    def _ink(self, image, y1, y2):
+        """句子区域中每个像素是否有笔画(与背景色不同)"""
+        region = image[y1:y2, self.left:self.right]
+        # 按通道分别比较，比对最后一维做any快得多
+        b, g, r = self.background
+        return (region[..., 0] != b) | (region[..., 1] != g) | (region[..., 2] != r)
+
+    def _fingerprint(self, image, y1, y2):
+        """句子区域的内容指纹: 逐行打包的笔画位图
+
+        句子读完后只会改变文字颜色，不会改变笔画的位置，因此指纹保持不变；
+        行的排布相同的其他句子笔画不同，不会被误认为同一句
+        """
+        return np.packbits(self._ink(image, y1, y2), axis=1).tobytes()
+
+    def _detect_scroll(self, image):
+        """在整个范围内查找上一句的笔画位图，返回离原位置最近的偏移量，找不到时返回None"""
+        y1, y2, fingerprint = self._last
+        height = y2 - y1
+        bottom = min(self.top + self.chunks * self.step, image.shape[0])
+        if bottom - self.top < height:
+            return None
+        rows = np.packbits(self._ink(image, self.top, bottom), axis=1)
+        expected = np.frombuffer(fingerprint, dtype=np.uint8).reshape(height, -1)
+        # 给每种行位图编号，在一维的编号序列上查找整句
+        numbers = {}
+        ids = np.array([numbers.setdefault(row.tobytes(), len(numbers)) for row in np.concatenate([rows, expected])])
+        windows = np.lib.stride_tricks.sliding_window_view(ids[:len(rows)], height)
+        offsets = np.flatnonzero((windows == ids[len(rows):]).all(axis=1)) + self.top - y1
+        offsets = offsets[offsets != 0]
+        if not len(offsets):
+            return None
+        return int(offsets[np.argmin(np.abs(offsets))])
+
+    def reset(self):
+        """忘记上一次找到的句子，下一次track()做完整查找"""
+        self._last = None
+        self.scroll_offset = 0
+
+    def find_block(self, image):
+        """查找下一句待读句子所在的区域，返回(y1, y2)，找不到时返回None"""
+        return self._search(image)
+
+    def find_blocks(self, image):
+        """查找整页中所有待读的句子，按朗读顺序返回[(y1, y2), ...]
+
+        每句读完后文字会变为已读的颜色，因此找到一句后从它的结尾继续查找，
+        与逐句朗读时每次find_block/track的结果一致。
+        """
+        unexpected, blank = self.chunk_profiles(image)
+        blocks = []
+        head = first = 0
+        while True:
+            head, tail = self._scan(unexpected, blank, head, first)
+            if tail is None:
+                return blocks
+            blocks.append((self.top + head * self.step, self.top + tail * self.step))
+            head = first = tail
+
+    def track(self, image):
+        """与find_block相同，但优先从上一次找到的句子处向下查找"""
+        start_chunk = 0
+        if self._last is not None:
+            y1, y2, fingerprint = self._last
+            if self._fingerprint(image, y1, y2) == fingerprint:
+                # 页面没有滚动，上一句之前的句子都已读过
+                start_chunk = (y1 - self.top) // self.step
+            else:
+                offset = self._detect_scroll(image)
+                if offset is not None:
+                    self.scroll_offset = offset
+                    self.logger.info(f"检测到页面滚动 {offset} 像素，重新查找句子")
+                else:
+                    self.logger.info("页面内容已变化，重新查找句子")
+
+        block = self._search(image, start_chunk)
+        self._last = None if block is None else (block[0], block[1], self._fingerprint(image, *block))
+        return block
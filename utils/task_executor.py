@@ -1,5 +1,8 @@
 from PySide6.QtCore import QThread, Signal
 import asyncio
+import inspect
+from .adb_async import AsyncADBController, shared_loop
+from .navigator import Navigator
 from .log import Logger
 
 class TaskExecutor(QThread):
@@ -12,52 +15,96 @@ class TaskExecutor(QThread):
         self.adb_controller = adb_controller
         self.logger = Logger().get_logger()
         self._running = True
+        self._future = None
 
     def stop(self):
         self._running = False
         self.logger.info("正在停止任务...")
-        # 强制退出
-        self.terminate()  # 强制终止线程
+        # 取消常驻事件循环中正在执行的任务，任务的finally(停止截图、关闭线程池)仍会执行
+        if self._future is not None:
+            self._future.cancel()
         self.wait()      # 等待线程完全停止
         self.adb_controller.disconnect()  # 确保断开ADB连接
         self.all_tasks_completed.emit()   # 发送任务完成信号
 
     def run(self):
         try:
-            asyncio.run(self.execute_tasks())
+            # 在常驻的事件循环中执行，异步ADB连接在多次执行之间保持
+            self._future = asyncio.run_coroutine_threadsafe(self.execute_tasks(), shared_loop())
+            self._future.result()
         except:
             # 捕获所有异常，确保在强制停止时不会产生未处理的异常
             pass
 
     async def execute_tasks(self):  # 将原来run方法中的execute_tasks移出来
-        # 确保ADB已连接
-        if not self.adb_controller.connect():
-            self.logger.error("无法连接到ADB设备，任务执行终止")
-            self.all_tasks_completed.emit()
-            return
-        
         try:
-            sorted_tasks = sorted(
-                [t for t in self.tasks if t is not None],
-                key=lambda x: x.priority
-            )
-            
-            for task in sorted_tasks:
-                if not self._running:
-                    self.logger.info("任务执行被用户终止")
-                    break
-                    
-                try:
-                    result = await task.execute(adb_controller=self.adb_controller)
-                    self.task_completed.emit(task.name, result)
-                    if task != sorted_tasks[-1] and self._running:
-                        self.logger.info("等待5秒后执行下一个任务...")
-                        await asyncio.sleep(5)
-                except Exception as e:
-                    self.logger.error(f"任务执行出错: {str(e)}")
-                    self.task_completed.emit(task.name, False)
-        
+            await run_tasks(self.tasks, self.adb_controller,
+                            lambda: self._running, self.task_completed.emit,
+                            AsyncADBController.shared(self.adb_controller.host, self.adb_controller.port))
         finally:
+            # 正常结束时保持ADB连接，下次执行无需重新连接
             if self._running:  # 只有在正常结束时才发送信号
-                self.adb_controller.disconnect()
                 self.all_tasks_completed.emit()
+
+
+def _execute_kwargs(task, **kwargs):
+    """只传入任务的execute能接收的参数，兼容按旧签名execute(self, adb_controller)编写的自定义任务"""
+    parameters = inspect.signature(task.execute).parameters.values()
+    if any(p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters):
+        return kwargs
+    names = {p.name for p in parameters}
+    return {key: value for key, value in kwargs.items() if key in names}
+
+
+async def run_tasks(tasks, adb_controller, is_running, on_task_completed, async_adb=None):
+    """连接设备并按优先级依次执行任务
+    is_running: 返回是否继续执行的函数
+    on_task_completed: 每个任务结束后以(任务名, 是否成功)调用
+    async_adb: 常驻的异步连接(AsyncADBController.shared)，执行结束后保持连接；
+        为None时临时创建一个，结束时断开
+    """
+    logger = Logger().get_logger()
+
+    # 确保ADB已连接
+    if not adb_controller.connect():
+        logger.error("无法连接到ADB设备，任务执行终止")
+        return False
+
+    # 输入和查询类命令走异步连接，不阻塞事件循环
+    owns_async_adb = async_adb is None
+    if owns_async_adb:
+        async_adb = AsyncADBController(adb_controller.host, adb_controller.port)
+    if not await async_adb.ensure_connected():
+        logger.error("无法连接到ADB设备，任务执行终止")
+        if owns_async_adb:
+            adb_controller.disconnect()
+        return False
+
+    # 任务之间等待画面稳定，而不是固定等待
+    navigator = Navigator(adb_controller, async_adb)
+
+    try:
+        sorted_tasks = sorted(
+            [t for t in tasks if t is not None],
+            key=lambda x: x.priority
+        )
+
+        for task in sorted_tasks:
+            if not is_running():
+                logger.info("任务执行被用户终止")
+                break
+
+            try:
+                result = await task.execute(**_execute_kwargs(task, adb_controller=adb_controller, async_adb=async_adb))
+                on_task_completed(task.name, result)
+                if task != sorted_tasks[-1] and is_running():
+                    logger.info("等待画面稳定后执行下一个任务...")
+                    await navigator.navigate(timeout=5)
+            except Exception as e:
+                logger.error(f"任务执行出错: {str(e)}")
+                on_task_completed(task.name, False)
+
+    finally:
+        if owns_async_adb:
+            await async_adb.disconnect()
+    return True
@@ -1,26 +1,111 @@
 from gtts import gTTS
+import io
+import itertools
 import os
-import sounddevice as sd
+import queue
+import subprocess
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+import wave
 import soundfile as sf
 from .log import Logger
 from pydub import AudioSegment
 import numpy as np
 from .config import Config
+from .tts_cache import AudioCache
+from .audio_output import AudioOutput, find_output_device, _resample, _to_mono
+from .audio_effects import time_stretch, trim_silence
+
+
+class TTSEngine(ABC):
+    """语音合成引擎的基类
+    voice: 音色，含义由各引擎决定，与引擎名一起作为缓存键的一部分
+    """
+    name = "未命名引擎"
+
+    def __init__(self, voice=''):
+        self.logger = Logger().get_logger()
+        self.voice = voice
+
+    @abstractmethod
+    def synthesize(self, text, lang):
+        """把text合成为内存中的PCM，返回(float32数组, 采样率)，失败时抛出异常"""
+        pass
+
+    def cache_params(self):
+        """除音色外其他影响合成结果的参数，作为缓存键的一部分；修改这些参数后不会再用到旧的缓存"""
+        return {}
+
+
+class GTTSEngine(TTSEngine):
+    """Google在线语音合成(需要联网)，返回的MP3直接在内存中解码
+    voice: Google翻译的域名后缀(tld)，决定口音，例如com、co.uk
+    """
+    name = "gtts"
+
+    def synthesize(self, text, lang):
+        buffer = io.BytesIO()
+        tts = gTTS(text=text, lang=lang, tld=self.voice or 'com')
+        tts.write_to_fp(buffer)
+        buffer.seek(0)
+        try:
+            # libsndfile 1.1以后可以直接解码MP3
+            return sf.read(buffer, dtype='float32')
+        except Exception:
+            # 不支持时通过pydub(ffmpeg)解码
+            buffer.seek(0)
+            audio = AudioSegment.from_file(buffer, format="mp3")
+            pcm = np.array(audio.get_array_of_samples(), dtype=np.float32) / (1 << (8 * audio.sample_width - 1))
+            if audio.channels > 1:
+                pcm = pcm.reshape(-1, audio.channels)
+            return pcm, audio.frame_rate
+
+
+class EspeakEngine(TTSEngine):
+    """本地espeak-ng语音合成，不需要联网，WAV从标准输出读取
+    voice: espeak-ng的音色名，例如en-us、en-gb，为空时使用语言代码
+    """
+    name = "espeak"
+
+    def __init__(self, command='espeak-ng', voice='', rate=None):
+        super().__init__(voice)
+        self.command = command
+        self.rate = rate  # 语速(每分钟单词数)，为空时使用默认值
+
+    def cache_params(self):
+        return {'rate': self.rate}
+
+    def synthesize(self, text, lang):
+        cmd = [self.command, '-v', self.voice or lang, '--stdout']
+        if self.rate:
+            cmd += ['-s', str(self.rate)]
+        # 文本从标准输入传入，避免以"-"开头的句子被当作参数
+        result = subprocess.run(cmd + ['--stdin'], input=text.encode('utf-8'), check=True, capture_output=True, timeout=30)
+        # 输出到管道时WAV头中的长度是占位值，用wave按实际数据读取
+        with wave.open(io.BytesIO(result.stdout)) as wav:
+            frames = wav.readframes(wav.getnframes())
+            pcm = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768
+            if wav.getnchannels() > 1:
+                pcm = pcm.reshape(-1, wav.getnchannels())
+            return pcm, wav.getframerate()
+
+
+def create_tts_engine(name, config=None):
+    """根据名称创建语音合成引擎
+    name: gtts / espeak
+    config: tts配置段
+    """
+    config = config or {}
+    if name == 'espeak':
+        return EspeakEngine(config.get('espeak_cmd', 'espeak-ng'), config.get('voice', ''), config.get('rate'))
+    return GTTSEngine(config.get('voice', ''))
+
 
 class TTSManager:
     _instance = None
     CABLE_INPUT_ID = None
     
-    def __init__(self):
-        self.config = Config()
-        devices = sd.query_devices()
-        for device_id, device in enumerate(devices):
-            # 匹配设备名称（兼容不同版本）
-            if "CABLE Input" in device.get('name', '') and device['max_output_channels'] > 0:
-                print(f"发现虚拟设备: ID={device_id}, 名称={device['name']}")
-                self.CABLE_INPUT_ID = device_id
-                break  # 选择第一个匹配项
-    
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(TTSManager, cls).__new__(cls)
@@ -29,63 +114,191 @@ class TTSManager:
 
     def _initialize(self):
         self.logger = Logger().get_logger()
+        self.config = Config()
+        # 输出设备只查找一次(多设备并行时每个工作进程使用各自的output_device)
+        output_device = self.config.get("tts", "output_device")
+        self.CABLE_INPUT_ID = find_output_device(output_device)
+        if self.CABLE_INPUT_ID is not None:
+            self.logger.info(f"发现虚拟设备 {output_device}: ID={self.CABLE_INPUT_ID}")
+        else:
+            self.logger.info(f"未发现虚拟设备 {output_device}，使用系统默认输出设备")
+        self._output = None
+        self._output_lock = threading.Lock()
         self.cache_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'audio')
-        os.makedirs(self.cache_dir, exist_ok=True)
+        self.cache = AudioCache(self.cache_dir, max_size=Config().get("tts", "cache_size") * 1024 * 1024)
+        self.engine = create_tts_engine(Config().get("tts", "engine"), Config().get("tts"))
+        self.logger.info(f"语音合成引擎: {self.engine.name}")
+        # 批量合成的工作线程池: 按优先级排队，相同的句子只合成一次
+        self._queue = queue.PriorityQueue()
+        self._inflight = {}  # 缓存键 -> 尚未完成的Future
+        self._queued = {}  # 缓存键 -> 排队中的最高优先级(最小值)
+        self._inflight_lock = threading.Lock()
+        self._order = itertools.count()  # 同优先级按提交顺序合成
+        self._workers = []
+
+    @property
+    def output(self):
+        """常驻的音频输出流，第一次使用时打开(通常在预取第一句时，早于开始播放)"""
+        with self._output_lock:
+            if self._output is None:
+                self._output = AudioOutput(self.CABLE_INPUT_ID,
+                                           blocksize=self.config.get("tts", "blocksize"),
+                                           latency=self.config.get("tts", "latency"))
+            return self._output
+
+    @property
+    def output_rate(self):
+        """输出流的采样率，合成的语音都重采样到这个采样率，播放时不需要再转换"""
+        return self.output.samplerate
+
+    def _effects(self):
+        """合成后的处理参数: 语速倍数和静音裁剪(阈值dB, 保留秒数)，不裁剪时为None"""
+        trim = None
+        if self.config.get("tts", "trim_silence"):
+            trim = [self.config.get("tts", "silence_threshold"), self.config.get("tts", "silence_padding")]
+        return {'tempo': self.config.get("tts", "tempo"), 'trim': trim}
+
+    def _cache_key(self, text, lang):
+        return self.cache.key(text, lang, self.engine.name, self.engine.voice, self.output_rate, self._effects(),
+                              self.engine.cache_params())
+
+    def _ensure_workers(self):
+        while len(self._workers) < max(1, Config().get("tts", "workers")):
+            worker = threading.Thread(target=self._worker_loop, name=f"TTSWorker-{len(self._workers)}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _worker_loop(self):
+        while True:
+            _, _, key, text, lang = self._queue.get()
+            with self._inflight_lock:
+                future = self._inflight.get(key)
+                # 同一句以更高优先级重复排队时，后出队的那一项直接跳过；已取消的在下面清理
+                if future is None or future.running() or (future.done() and not future.cancelled()):
+                    continue
+                self._queued.pop(key, None)
+                if not future.set_running_or_notify_cancel():
+                    self._inflight.pop(key, None)
+                    continue
+            try:
+                future.set_result(self.text_to_speech(text, lang))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._inflight_lock:
+                    self._inflight.pop(key, None)
+
+    def submit(self, text, lang=None, priority=0):
+        """提交一句话的语音合成，返回Future，结果为语音文件路径(失败时为None)
+        priority: 越小越先合成；同一句正在排队或合成时返回同一个Future
+        """
+        if lang is None:
+            lang = Config().get("tts", "language")
+        key = self._cache_key(text, lang)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None and future.cancelled():
+                # 调用者已取消(例如任务结束时取消了等待它的协程)，重新提交
+                self._inflight.pop(key)
+                self._queued.pop(key, None)
+                future = None
+            if future is None:
+                future = Future()
+                path = self.cache.get(key)
+                if path is not None:
+                    future.set_result(path)
+                    return future
+                self._inflight[key] = future
+            elif future.running() or future.done() or priority >= self._queued[key]:
+                return future
+            # 重复提交且优先级更高时再排一次队，先出队的一项负责合成
+            self._queued[key] = priority
+            self._queue.put((priority, next(self._order), key, text, lang))
+            self._ensure_workers()
+        return future
+
+    def text_to_speech_batch(self, texts, lang=None, priority=0):
+        """批量提交语音合成，按列表顺序依次降低优先级，返回与texts对应的Future列表"""
+        return [self.submit(text, lang, priority + index) for index, text in enumerate(texts)]
 
     def text_to_speech(self, text, lang=None):
         if lang is None:
             lang = self.config.get("tts", "language")
         try:
-            # 生成音频文件名
-            filename_mp3 = os.path.join(self.cache_dir, f"{hash(text)}.mp3")
-            filename_wav = os.path.join(self.cache_dir, f"{hash(text)}.wav")
+            # 以文本、语言、引擎及其参数、采样率和处理参数的摘要作为缓存键，多次运行之间保持一致
+            key = self._cache_key(text, lang)
+            filename = self.cache.get(key)
+            if filename is not None:
+                self.logger.debug(f"使用缓存的语音文件: {filename}")
+                return filename
             
-            # 如果缓存中没有，则生成新的音频文件
-            if not os.path.exists(filename_wav):
-                tts = gTTS(text=text, lang=lang)
-                tts.save(filename_mp3)
-                audio = AudioSegment.from_mp3(filename_mp3)
-                audio.export(filename_wav, format="wav")
-                self.logger.info(f"已生成语音文件: {filename_wav}")
-                os.remove(filename_mp3)
+            # 如果缓存中没有，则在内存中合成并转换为输出设备采样率的16位PCM
+            pcm, rate = self.engine.synthesize(text, lang)
+            pcm = _to_mono(pcm)
+            # 裁剪首尾静音并加快语速(在重采样之前，按引擎的采样率计算量更小)，结果随缓存只计算一次
+            effects = self._effects()
+            if effects['trim']:
+                pcm = trim_silence(pcm, rate, *effects['trim'])
+            if effects['tempo'] and effects['tempo'] != 1:
+                pcm = time_stretch(pcm, rate, effects['tempo'])
+            pcm = _resample(pcm, rate, self.output_rate)
+            pcm = (np.clip(pcm, -1, 1) * 32767).astype(np.int16)
             
-            return filename_wav
+            # 先写入临时文件，完成后再放入缓存
+            temp_path = self.cache.temp_path('.npy')
+            try:
+                with open(temp_path, 'wb') as f:
+                    np.save(f, pcm)
+                filename = self.cache.put(key, temp_path, text)
+                self.logger.info(f"已生成语音文件: {filename}")
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            
+            return filename
         except Exception as e:
             self.logger.error(f"TTS转换失败: {str(e)}")
             return None
 
-    def play_audio(self, file_path):
-        """播放音频到虚拟输出设备或默认输出设备"""
+    def load_audio(self, file_path):
+        """读取语音文件，返回(PCM, 采样率)
+        缓存中的.npy文件以内存映射方式打开，不需要解码
+        """
+        if file_path.endswith('.npy'):
+            return np.load(file_path, mmap_mode='r'), self.output_rate
+        return sf.read(file_path)
+
+    def play(self, file_path):
+        """开始播放音频并立即返回Playback(可await，可stop)，失败时返回None"""
         try:
-            # 读取音频文件
-            data, samplerate = sf.read(file_path)
-            
-            if self.CABLE_INPUT_ID is not None:
-                # 使用虚拟音频设备
-                device_info = sd.query_devices(self.CABLE_INPUT_ID)
-                device_id = self.CABLE_INPUT_ID
-                self.logger.debug(f"使用虚拟音频设备(ID={device_id})")
-            else:
-                # 使用默认输出设备
-                device_info = sd.query_devices(sd.default.device[1])
-                device_id = None  # None 表示使用默认设备
-                self.logger.debug("使用系统默认输出设备")
-            
-            # 获取设备通道数
-            channels = device_info['max_output_channels']
-            
-            # 如果音频是单声道但设备支持双声道，转换为双声道
-            if len(data.shape) == 1 and channels > 1:
-                data = data.reshape(-1, 1)
-                data = np.column_stack((data, data))
-            
-            # 播放音频
-            self.logger.info("开始播放音频...")
-            sd.play(data, samplerate, device=device_id)
-            sd.wait()
+            data, samplerate = self.load_audio(file_path)
+            playback = self.output.play(data, samplerate)
+            self.logger.info(f"开始播放音频({playback.duration:.1f} 秒)...")
+            return playback
+        except Exception as e:
+            self.logger.error(f"音频播放失败: {str(e)}")
+            return None
+
+    def play_audio(self, file_path, on_start=None):
+        """播放音频到虚拟输出设备或默认输出设备，播放完成后返回(会阻塞，异步任务中使用play)
+        on_start: 开始播放时调用，用于统计延迟
+        """
+        playback = self.play(file_path)
+        if playback is None:
+            return False
+        try:
+            # 超时说明输出流已停止(例如设备被移除)，下次播放时重新打开
+            timeout = playback.duration + 2
+            if not playback.started.wait(timeout):
+                raise TimeoutError("输出流没有响应")
+            if on_start:
+                on_start()
+            if not playback.finished.wait(timeout):
+                raise TimeoutError("播放超时")
             self.logger.info("音频播放完成")
             return True
             
         except Exception as e:
+            playback.stop()
             self.logger.error(f"音频播放失败: {str(e)}")
             return False
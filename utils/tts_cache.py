@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from .disk_cache import DiskLRU
+from .log import Logger
+
+# 旧版本的缓存文件: 以hash(text)命名(每次启动哈希值都不同)的以及WAV格式的
+LEGACY_NAME = re.compile(r'^(-?\d+|[0-9a-f]{32})\.(wav|mp3)$')
+
+
+class AudioCache:
+    """语音文件缓存
+
+    缓存的是输出设备采样率下的16位单声道PCM(.npy)，播放时以内存映射方式读取。
+    以(文本, 语言, 引擎, 音色, 采样率, 处理参数, 引擎参数)的稳定摘要为键，文件名在不同进程和多次运行之间保持一致。
+    超过大小上限时删除最久未用的文件(DiskLRU)。
+    生成的文件先写到临时文件，完成后原子地替换到位，多个线程或进程同时生成同一句也不会得到损坏的文件。
+    """
+
+    def __init__(self, cache_dir, max_size=256 * 1024 * 1024):
+        self.logger = Logger().get_logger()
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self.lru = DiskLRU(cache_dir, max_size, suffix='.npy', name="语音缓存")
+        self._remove_legacy()
+
+    @staticmethod
+    def key(text, lang, engine, voice='', rate=None, effects=None, params=None):
+        """params: 引擎的其他参数(TTSEngine.cache_params)，例如espeak的语速"""
+        payload = json.dumps([text, lang, engine, voice, rate, effects, params or {}], ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+    def path(self, key):
+        return self.lru.path(key)
+
+    def temp_path(self, suffix='.npy'):
+        """返回一个不会与其他生成者冲突的临时文件路径"""
+        return self.lru.temp_path(suffix)
+
+    def _remove_legacy(self):
+        """清理旧版本的文件(索引中缺少的文件由DiskLRU在加载时收回)"""
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if LEGACY_NAME.match(name):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get(self, key):
+        """返回缓存的语音文件路径，不存在时返回None"""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with self._lock:
+            if key not in self.lru.entries:
+                self.lru.entries[key] = {'size': os.path.getsize(path), 'used': time.time()}
+            self.lru.touch(key)
+        return path
+
+    def put(self, key, temp_path, text=''):
+        """把生成好的临时文件放入缓存，返回缓存中的路径"""
+        path = self.path(key)
+        os.replace(temp_path, path)
+        with self._lock:
+            self.lru.add(key, {'size': os.path.getsize(path), 'text': text})
+        return path